@@ -1,18 +1,47 @@
 
 import datetime
-import pygrib
+from eccodes import (codes_grib_new_from_file, codes_get, codes_get_double_array,
+                     codes_release, CodesInternalError)
 import numpy as np
 import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os 
-import math
 import json
 from pathlib import Path
 import gzip
+import io
+import sqlite3
+from functools import partial
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
+from PIL import Image, ImageDraw
+
+try:
+    import zstandard as zstd
+except ImportError:  # fall back to a deflate compressed .npz
+    zstd = None
+
+try:
+    import numexpr as ne
+except ImportError:  # plain numpy expression below
+    ne = None
+
+try:
+    import orjson
+except ImportError:  # stdlib json for the vector tiles
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:  # numpy version of the raster kernel
+    njit = None
 
 GENERATE_VECTORTILES = False
 GENERATE_RASTERTILES = True
+WRITE_MBTILES = False    # one SQLite .mbtiles container per tile set instead of zoom/x/y files
 
 # reference:  "https://charts.ecmwf.int/products/medium-wind-100m" +  f"?base_time={base_time}&projection=opencharts_europe&valid_time={base_time}"
 
@@ -35,13 +64,18 @@ prefix = "https://data.ecmwf.int/forecasts/"
 postfix = "-12h-oper-fc.grib2"
 primary_url = f"{prefix}{day_date}/{slot}/aifs-single/0p25/oper/{file_start}{postfix}"
 
+# one pooled keep-alive session for the probes, the index and the download (same host)
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4,
+                                      max_retries=Retry(total=2, backoff_factor=0.5)))
+
 def _url_exists(url):
     try:
         # prefer HEAD, but fall back to a lightweight GET if HEAD is not supported
-        r = requests.head(url, timeout=10, allow_redirects=True)
+        r = session.head(url, timeout=10, allow_redirects=True)
         if r.status_code == 200:
             return True
-        r = requests.get(url, stream=True, timeout=10)
+        r = session.get(url, stream=True, timeout=10)
         r.close()
         return r.status_code == 200
     except Exception:
@@ -84,15 +118,69 @@ print(f"Ensuring output directory: {out_dir.resolve()}")
 os.chdir(out_dir)
 local_basename = os.path.basename(remote_url)
 local_path = Path(local_basename)
+
+def _grib_index_ranges(url, params=("100u", "100v")):
+    """Byte ranges (offset, length) of the wanted fields, read from the ECMWF index file.
+
+    ECMWF publishes a JSON-lines .index next to every .grib2 file. Returns None
+    if the index is missing or does not list all wanted params.
+    """
+    index_url = url.rsplit(".", 1)[0] + ".index"
+    try:
+        r = session.get(index_url, timeout=30)
+        if r.status_code != 200:
+            return None
+        ranges = {}
+        for line in r.text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("param") in params:
+                ranges[entry["param"]] = (int(entry["_offset"]), int(entry["_length"]))
+    except Exception:
+        return None
+    if len(ranges) != len(params):
+        return None
+    return sorted(ranges.values())
+
+def _preallocate(fh, size):
+    """Reserve the disk space of a download up front (Linux only, size 0 = unknown)"""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fh.fileno(), 0, size)
+        except OSError:
+            pass
+
 if not local_path.exists():
-    print("Downloading", local_basename, "...")
     try:
-        with requests.get(remote_url, stream=True, timeout=30) as r:
-            r.raise_for_status()
-            with open(local_path, "wb") as fh:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        fh.write(chunk)
+        # only fetch the 100m wind messages if possible; concatenated GRIB messages are a valid GRIB file
+        ranges = _grib_index_ranges(remote_url)
+        with open(local_path, "wb") as fh:
+            if ranges:
+                print("Downloading", len(ranges), "fields of", local_basename, "...")
+                _preallocate(fh, sum(length for _, length in ranges))
+                for offset, length in ranges:
+                    byte_range = {"Range": f"bytes={offset}-{offset + length - 1}"}
+                    with session.get(remote_url, headers=byte_range, stream=True, timeout=30) as r:
+                        r.raise_for_status()
+                        if r.status_code != 206:
+                            # server ignored the range request and sends the whole file
+                            fh.seek(0)
+                            fh.truncate()
+                            _preallocate(fh, int(r.headers.get("Content-Length", 0)))
+                            for chunk in r.iter_content(chunk_size=1 << 20):
+                                fh.write(chunk)
+                            break
+                        for chunk in r.iter_content(chunk_size=1 << 20):
+                            fh.write(chunk)
+            else:
+                print("Downloading", local_basename, "...")
+                with session.get(remote_url, stream=True, timeout=30) as r:
+                    r.raise_for_status()
+                    _preallocate(fh, int(r.headers.get("Content-Length", 0)))
+                    for chunk in r.iter_content(chunk_size=1 << 20):
+                        if chunk:
+                            fh.write(chunk)
         print("Downloaded to", local_path)
     except Exception as exc:
         print("Failed to download remote GRIB:", exc)
@@ -101,7 +189,7 @@ else:
     print("Target file:", local_path)
     exit()
 
-# set filename to the local file path for subsequent pygrib.open(...)
+# set filename to the local file path for the GRIB reader below
 filename = str(local_path)
 gribFile = filename    
 
@@ -111,56 +199,98 @@ u_wind = None
 v_wind = None
 lats = lons = None
 
-with pygrib.open(filename) as grbs:
+# wind unit patterns, eccodes reports m/s as "m s**-1"
+_KNOT_RE = re.compile(r'\bknots?\b|\bkt\b|\bkn\b')
+_MS_RE = re.compile(r'm\s*/\s*s|\bm/s\b|m\s*s-1|m\s*s-?1|m\s*s\*\*-1')
+
+def _conversion_to_m_s(units):
+    """Factor converting wind in the given GRIB units to m/s (1 knot = 0.514444 m/s)"""
+    lowered = units.lower()
+    if _KNOT_RE.search(lowered):
+        return 0.514444
+    if not _MS_RE.search(lowered):
+        # unknown unit, assume m/s but inform the user
+        print(f"Warning: Unrecognized wind units '{units}', assuming m/s")
+    return 1.0
+
+def _grib_key(h, key, default=None):
+    try:
+        return codes_get(h, key)
+    except CodesInternalError:
+        return default
+
+def _grib_values(h):
+    """Decode the data section of a message into a (Nj, Ni) array, masked where the bitmap says so"""
+    values = codes_get_double_array(h, "values").reshape(codes_get(h, "Nj"), codes_get(h, "Ni"))
+    if _grib_key(h, "bitmapPresent", 0):
+        return np.ma.masked_equal(values, codes_get(h, "missingValue"))
+    return values
+
+def _grib_latlons(h, shape):
+    """Lat/lon grid of a message. Regular lat/lon grids are built from the grid
+    definition, anything else falls back to the per-point coordinate arrays."""
+    if _grib_key(h, "gridType") == "regular_ll":
+        dj = codes_get(h, "jDirectionIncrementInDegrees")
+        di = codes_get(h, "iDirectionIncrementInDegrees")
+        if not codes_get(h, "jScansPositively"):
+            dj = -dj
+        if codes_get(h, "iScansNegatively"):
+            di = -di
+        lon0 = codes_get(h, "longitudeOfFirstGridPointInDegrees")
+        # GRIB2 stores longitudes in [0, 360); a grid starting at -180 comes back as 180
+        if di > 0 and lon0 > codes_get(h, "longitudeOfLastGridPointInDegrees"):
+            lon0 -= 360.0
+        lat = codes_get(h, "latitudeOfFirstGridPointInDegrees") + dj * np.arange(shape[0])
+        lon = lon0 + di * np.arange(shape[1])
+        lons, lats = np.meshgrid(lon, lat)
+        return lats, lons
+    return (codes_get_double_array(h, "latitudes").reshape(shape),
+            codes_get_double_array(h, "longitudes").reshape(shape))
+
+with open(filename, "rb") as grbs:
     wind_input_unit = None
     conversion_factor = 1.0
 
-    for grb in grbs:
-        sn = (getattr(grb, "shortName", "") or "").lower()
-        name = (getattr(grb, "name", "") or "").lower()
-        level = getattr(grb, "level", None)
-        tlevel = (getattr(grb, "typeOfLevel", "") or "").lower()
-        units = (getattr(grb, "units", "") or "").strip()
-
-        print(f"Found field: shortName={sn}, name={name}, level={level}, typeOfLevel={tlevel}, units={units}")
-
-        # try several matching heuristics (shortName/name like '100u'/'100v' or u/v at 100m height)
-        if "100u" in sn or "100u" in name or (sn in ("u", "u_component_of_wind") and "height" in tlevel and level == 100):
-            print("Matched u wind")
-            # determine units and conversion to m/s (1 knot = 0.514444 m/s)
-            if wind_input_unit is None and units:
-                wind_input_unit = units
-                u_units = units.lower()
-                if re.search(r'\bknots?\b|\bkt\b|\bkn\b', u_units):
-                    conversion_factor = 0.514444
-                elif re.search(r'm\s*/\s*s|\bm/s\b|m\s*s-1|m\s*s-?1', u_units):
-                    conversion_factor = 1.0
-                else:
-                    # unknown unit, assume m/s but inform the user
-                    conversion_factor = 1.0
-                    print(f"Warning: Unrecognized wind units '{units}', assuming m/s")
-
-            u_wind = grb.values * conversion_factor
-            lats, lons = grb.latlons()
-
-        if "100v" in sn or "100v" in name or (sn in ("v", "v_component_of_wind") and "height" in tlevel and level == 100):
-            print("Matched v wind")
-            if wind_input_unit is None and units:
-                wind_input_unit = units
-                v_units = units.lower()
-                if re.search(r'\bknots?\b|\bkt\b|\bkn\b', v_units):
-                    conversion_factor = 0.514444
-                elif re.search(r'm\s*/\s*s|\bm/s\b|m\s*s-1|m\s*s-?1', v_units):
-                    conversion_factor = 1.0
-                else:
-                    conversion_factor = 1.0
-                    print(f"Warning: Unrecognized wind units '{units}', assuming m/s")
-
-            v_wind = grb.values * conversion_factor
-            lats, lons = grb.latlons()
-
-        if u_wind is not None and v_wind is not None:
+    while True:
+        # only header keys are read per message; values are decoded for the u/v matches only
+        grb = codes_grib_new_from_file(grbs)
+        if grb is None:
             break
+        try:
+            sn = (_grib_key(grb, "shortName", "") or "").lower()
+            name = (_grib_key(grb, "name", "") or "").lower()
+            level = _grib_key(grb, "level")
+            tlevel = (_grib_key(grb, "typeOfLevel", "") or "").lower()
+            units = (_grib_key(grb, "units", "") or "").strip()
+
+            print(f"Found field: shortName={sn}, name={name}, level={level}, typeOfLevel={tlevel}, units={units}")
+
+            # try several matching heuristics (shortName/name like '100u'/'100v' or u/v at 100m height)
+            if "100u" in sn or "100u" in name or (sn in ("u", "u_component_of_wind") and "height" in tlevel and level == 100):
+                print("Matched u wind")
+                # determine units and conversion to m/s
+                if wind_input_unit is None and units:
+                    wind_input_unit = units
+                    conversion_factor = _conversion_to_m_s(units)
+
+                u_wind = _grib_values(grb) * conversion_factor
+                if lats is None:
+                    lats, lons = _grib_latlons(grb, u_wind.shape)
+
+            if "100v" in sn or "100v" in name or (sn in ("v", "v_component_of_wind") and "height" in tlevel and level == 100):
+                print("Matched v wind")
+                if wind_input_unit is None and units:
+                    wind_input_unit = units
+                    conversion_factor = _conversion_to_m_s(units)
+
+                v_wind = _grib_values(grb) * conversion_factor
+                if lats is None:
+                    lats, lons = _grib_latlons(grb, v_wind.shape)
+
+            if u_wind is not None and v_wind is not None:
+                break
+        finally:
+            codes_release(grb)
 
     # Save detected original unit and applied conversion factor for later usage
     wind_meta = {
@@ -191,23 +321,38 @@ def _data_and_mask(arr):
 u_data, u_mask = _data_and_mask(u_wind)
 v_data, v_mask = _data_and_mask(v_wind)
 
-speed = np.hypot(u_data, v_data)
+# u/v are far from overflow, so the range-safe np.hypot is not needed
+if ne is not None:
+    speed = ne.evaluate("sqrt(u_data * u_data + v_data * v_data)")
+else:
+    speed = np.sqrt(u_data * u_data + v_data * v_data)
 speed_mask = u_mask | v_mask
 
-np.savez_compressed(
-    outname,
-    u=u_data,
+# float32 is plenty for wind components and grid coordinates and halves the output
+wind_arrays = dict(
+    u=u_data.astype(np.float32),
     u_mask=u_mask,
-    v=v_data,
+    v=v_data.astype(np.float32),
     v_mask=v_mask,
-    speed=speed,
+    speed=speed.astype(np.float32),
     speed_mask=speed_mask,
-    lats=lats,
-    lons=lons,
+    lats=lats.astype(np.float32),
+    lons=lons.astype(np.float32),
     source_grib=filename,
 )
-    
-print(f"Wrote output to {outname}")
+# build the file in memory and write it with a single call
+npz_buf = io.BytesIO()
+if zstd is not None:
+    # uncompressed .npz in memory, compressed with zstd (much faster than deflate)
+    np.savez(npz_buf, **wind_arrays)
+    outfile = outname + ".zst"
+    Path(outfile).write_bytes(zstd.ZstdCompressor(level=3).compress(npz_buf.getbuffer()))
+else:
+    np.savez_compressed(npz_buf, **wind_arrays)
+    outfile = outname
+    Path(outfile).write_bytes(npz_buf.getbuffer())
+
+print(f"Wrote output to {outfile}")
 
 # truncate (don't remove) the downloaded GRIB file to save space (and its metadata if present)
 try:
@@ -256,22 +401,25 @@ except Exception:
     pass
 
 
-# Create a combined valid-data mask and masked arrays
-mask_all = u_mask | v_mask | np.isnan(u_data) | np.isnan(v_data)
-u_ma = np.ma.array(u_data, mask=mask_all)
-v_ma = np.ma.array(v_data, mask=mask_all)
+# Create a combined valid-data mask
+# (speed is NaN exactly where u or v is, and the GRIB masks are usually all False)
+mask_all = np.isnan(speed)
+if speed_mask.any():
+    np.logical_or(mask_all, speed_mask, out=mask_all)
 speed_ma = np.ma.array(speed, mask=mask_all)
 
 # Decimate the grid for barbs so the plot is legible
-ny, nx = u_ma.shape
+ny, nx = mask_all.shape
 target_points = 90  # target number of points along long axis
 step_x = max(1, nx // target_points)
 step_y = max(1, ny // target_points)
 
-lons_s = lons[::step_y, ::step_x]
-lats_s = lats[::step_y, ::step_x]
-u_s = u_ma[::step_y, ::step_x]
-v_s = v_ma[::step_y, ::step_x]
+# compact 1-D arrays of the valid decimated points only, nothing masked left for matplotlib
+good_s = ~mask_all[::step_y, ::step_x]
+lons_s = lons[::step_y, ::step_x][good_s]
+lats_s = lats[::step_y, ::step_x][good_s]
+u_s = u_data[::step_y, ::step_x][good_s]
+v_s = v_data[::step_y, ::step_x][good_s]
 
 # Create figure: background is wind speed, overlay barbs
 fig, ax = plt.subplots(figsize=(16, 8))  # ration is 2 : 1
@@ -313,30 +461,61 @@ print(f"Wrote windbarb image to {figname}")
 # - Limit features per tile
 # - Deterministic random sampling per tile to preserve spatial spread
 # - Reduce numeric precision to shrink JSON
-# - Save tiles compressed (.json.gz)
+# - Save tiles compressed (.json.zst, .json.gz without zstandard)
 
 # Create vector tiles with wind barbs
 
 def latlon_to_tile(lat, lon, zoom):
-    """Convert lat/lon to tile coordinates at given zoom level"""
-    lat_rad = math.radians(lat)
+    """Convert lat/lon (scalars or numpy arrays) to tile coordinates at given zoom level"""
     n = 2.0 ** zoom
-    x = int((lon + 180.0) / 360.0 * n)
-    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    x = np.floor((np.asarray(lon) + 180.0) / 360.0 * n).astype(np.int64)
+    y = np.floor((1.0 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2.0 * n).astype(np.int64)
     return x, y
 
 def tile_bounds(x, y, zoom):
-    """Get lat/lon bounds for a tile"""
+    """Get lat/lon bounds for a tile (scalars or numpy arrays)"""
     n = 2.0 ** zoom
     lon_min = x / n * 360.0 - 180.0
     lon_max = (x + 1) / n * 360.0 - 180.0
-    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
-    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    lat_max = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+    lat_min = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / n))))
     return lat_min, lon_min, lat_max, lon_max
 
-# Create tiles directory
+def tile_cells(zoom):
+    """Flat indices and tile x/y at given zoom level of all valid grid cells on the map"""
+    valid_idx = np.flatnonzero(~mask_all)
+    n = 2 ** zoom
+    tx, ty = latlon_to_tile(lats_flat[valid_idx], lons_flat[valid_idx], zoom)
+    # cells beyond the web mercator tile range (poles, lon == 180) are never requested
+    on_map = (tx >= 0) & (tx < n) & (ty >= 0) & (ty < n)
+    return valid_idx[on_map], tx[on_map], ty[on_map]
+
+def tile_buckets(zoom, cells, cells_zoom):
+    """Bucket grid cells into their tiles at given zoom level.
+
+    cells are the tile_cells() of a zoom level >= zoom; tiles form a quadtree, so
+    the tile of a cell at a lower zoom is its deeper tile shifted right.
+    Returns (tile_x, tile_y, starts, ends, cell_idx) with one entry per non-empty
+    tile; the flat grid indices of tile k are cell_idx[starts[k]:ends[k]].
+    """
+    valid_idx, tx, ty = cells
+    tx, ty = tx >> (cells_zoom - zoom), ty >> (cells_zoom - zoom)
+    n = 2 ** zoom
+
+    # stable sort keeps cells of a tile in grid order (same as flatnonzero)
+    key = tx * n + ty
+    order = np.argsort(key, kind="stable")
+    key_sorted = key[order]
+    tile_keys = np.unique(key_sorted)
+    starts = np.searchsorted(key_sorted, tile_keys, side="left")
+    ends = np.searchsorted(key_sorted, tile_keys, side="right")
+    return tile_keys // n, tile_keys % n, starts, ends, valid_idx[order]
+
+# Create tiles directories
 tiles_dir = Path("wind_tiles")
-tiles_dir.mkdir(exist_ok=True)
+raster_dir = Path("raster_tiles")
+TILE_EXT = ".json.zst" if zstd is not None else ".json.gz"
+tile_cctx = zstd.ZstdCompressor(level=3) if zstd is not None else None
 
 # Generate tiles for zoom levels
 zoom_levels = [1, 2, 3, 4, 5, 6]
@@ -348,216 +527,343 @@ LAT_LON_PREC = 4                  # decimal places for lat/lon
 VEL_PREC = 2                      # decimal places for u/v/speed
 DIR_PREC = 1                      # decimal places for direction
 
-# precompute global bounds once
-global_lat_min = float(np.nanmin(lats))
-global_lat_max = float(np.nanmax(lats))
-global_lon_min = float(np.nanmin(lons))
-global_lon_max = float(np.nanmax(lons))
+# flat views of the grid, tile buckets hold flat indices into these
+lats_flat, lons_flat = lats.ravel(), lons.ravel()
+u_flat, v_flat, speed_flat = u_data.ravel(), v_data.ravel(), speed.ravel()
+
+# bucket grid cells into tiles once per zoom (shared by vector and raster tiles),
+# the mercator projection only runs once at the deepest zoom
+deepest_cells = tile_cells(max(zoom_levels))
+buckets = {zoom: tile_buckets(zoom, deepest_cells, max(zoom_levels)) for zoom in zoom_levels}
+
+def tile_tasks():
+    """List (zoom, tx, ty, start, end) for every non-empty tile of all zoom levels"""
+    tasks = []
+    for zoom in zoom_levels:
+        tile_xs, tile_ys, starts, ends, _ = buckets[zoom]
+        tasks.extend((zoom, tx, ty, start, end) for tx, ty, start, end in
+                     zip(tile_xs.tolist(), tile_ys.tolist(), starts.tolist(), ends.tolist()))
+    return tasks
+
+def sample_k(rng, idx, k):
+    """Pick k distinct entries of idx in O(k), rng.choice without replacement permutes all of idx"""
+    picked = np.empty(0, dtype=np.int64)
+    while picked.size < k:
+        # draw extra positions, drop repeats keeping first occurrences in draw order
+        pos = np.concatenate((picked, rng.integers(0, idx.size, size=2 * (k - picked.size))))
+        _, first = np.unique(pos, return_index=True)
+        picked = pos[np.sort(first)][:k]
+    return idx[picked]
+
+def tile_points(task):
+    """Gather lat, lon, u, v and speed of the points drawn in one tile"""
+    zoom, tx, ty, start, end = task
+    idx = buckets[zoom][4][start:end]
+    N = idx.size
+
+    # If too many points, pick a deterministic random subset for even spread
+    if N > MAX_FEATURES_PER_TILE:
+        keep = TARGET_FEATURES_PER_TILE
+        seed = ((zoom & 0xFFFF) << 32) ^ ((tx & 0xFFFF) << 16) ^ (ty & 0xFFFF)
+        rng = np.random.default_rng(seed)
+        choose = sample_k(rng, idx, keep)
+    else:
+        choose = idx  # use all
+
+    return lats_flat[choose], lons_flat[choose], u_flat[choose], v_flat[choose], speed_flat[choose]
+
+MBTILES_BATCH = 1000
+
+def open_mbtiles(path, name, tile_format):
+    """Open (or create) an MBTiles container with its tiles and metadata tables"""
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+    con.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, "
+                "tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row))")
+    con.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                    [("name", name), ("format", tile_format),
+                     ("minzoom", str(min(zoom_levels))), ("maxzoom", str(max(zoom_levels)))])
+    return con
+
+def tile_worker(render, base_dir, ext, task):
+    """Render one tile and write it to base_dir/zoom/x/y<ext>, or hand it back for the MBTiles container"""
+    zoom, tx, ty, _, _ = task
+    data = render(task)
+    if WRITE_MBTILES:
+        return zoom, tx, ty, data
+    (base_dir / str(zoom) / str(tx) / f"{ty}{ext}").write_bytes(data)
+    return zoom, tx, ty, None
+
+def run_tiles(render, base_dir, ext, tile_format):
+    """Render all tiles in worker processes, returns number of tiles created per zoom"""
+    tasks = tile_tasks()
+    if WRITE_MBTILES:
+        con = open_mbtiles(base_dir.with_suffix(".mbtiles"), base_dir.name, tile_format)
+    else:
+        # create target directories up front, workers only write files
+        for zoom, tx in {(t[0], t[1]) for t in tasks}:
+            (base_dir / str(zoom) / str(tx)).mkdir(parents=True, exist_ok=True)
+
+    created = dict.fromkeys(zoom_levels, 0)
+    batch = []
+    print(f"Rendering {len(tasks)} tiles on {os.cpu_count()} processes...")
+    # fork: workers inherit grids and buckets without pickling and without re-running this script
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("fork")) as ex:
+        for zoom, tx, ty, data in ex.map(partial(tile_worker, render, base_dir, ext), tasks, chunksize=64):
+            created[zoom] += 1
+            if data is None:
+                continue
+            # MBTiles rows count from the south (TMS), our tile y from the north
+            batch.append((zoom, tx, (1 << zoom) - 1 - ty, data))
+            if len(batch) >= MBTILES_BATCH:
+                con.executemany("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", batch)
+                batch.clear()
+    if WRITE_MBTILES:
+        # all inserts are one transaction
+        con.executemany("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", batch)
+        con.commit()
+        con.close()
+    return created
+
+def tile_count(created, base_dir, ext, zoom):
+    """Number of tiles stored for a zoom level"""
+    if WRITE_MBTILES:
+        return created[zoom]
+    return len(list((base_dir / str(zoom)).rglob(f"*{ext}")))
+
+def render_vector_tile(task):
+    zoom, tx, ty, start, end = task
+    tile_lats, tile_lons, tile_u, tile_v, tile_speed = tile_points(task)
+
+    # Build features with reduced precision to save space
+    # (direction and rounding computed for the whole tile at once in numpy)
+    tile_dir = np.degrees(np.arctan2(tile_v, tile_u))
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {"u": u, "v": v, "speed": s, "direction": d},
+        }
+        for lon, lat, u, v, s, d in zip(
+            np.round(tile_lons, LAT_LON_PREC).tolist(),
+            np.round(tile_lats, LAT_LON_PREC).tolist(),
+            np.round(tile_u, VEL_PREC).tolist(),
+            np.round(tile_v, VEL_PREC).tolist(),
+            np.round(tile_speed, VEL_PREC).tolist(),
+            np.round(tile_dir, DIR_PREC).tolist(),
+        )
+    ]
+
+    geojson = {"type": "FeatureCollection", "features": features}
+
+
+    # Decompress in browser:
+    #// .json.zst tiles: decode the ArrayBuffer with fzstd (or serve with Content-Encoding: zstd)
+    #// <script src="https://cdn.jsdelivr.net/npm/fzstd@0.1/umd/index.js"></script>
+    #// const buf = await (await fetch('/tiles/3/1/2.json.zst')).arrayBuffer();
+    #// const geojson = JSON.parse(new TextDecoder().decode(fzstd.decompress(new Uint8Array(buf))));
+    #//
+    #// .json.gz tiles:
+    #// Browser-friendly decompression: DecompressionStream if available (Chromium/Firefox and recent Safari),
+    #// otherwise fall back to inflating the ArrayBuffer client-side (e.g. with pako).
+    #// Include pako on the page if you need the fallback:
+    #// <script src="https://cdn.jsdelivr.net/npm/pako@2/dist/pako.min.js"></script>
+    #//
+    #// Example usage in JS:
+    #// async function fetchGzJson(url) {
+    #//   const res = await fetch(url, { mode: 'cors' });
+    #//   if ('DecompressionStream' in self) {
+    #//     // Modern browsers (Chromium, Firefox, and recent Safari)
+    #//     const ds = res.body.pipeThrough(new DecompressionStream('gzip'));
+    #//     const text = await new Response(ds).text();
+    #//     return JSON.parse(text);
+    #//   } else {
+    #//     // Fallback for older Safari / browsers without DecompressionStream
+    #//     const buf = await res.arrayBuffer();
+    #//     // pako must be available (via CDN or bundled)
+    #//     const inflated = pako.inflate(new Uint8Array(buf), { to: 'string' });
+    #//     return JSON.parse(inflated);
+    #//   }
+    #// }
+    #//
+    #// // call it:
+    #// fetchGzJson('/tiles/3/1/2.json.gz').then(geojson => console.log(geojson)).catch(console.error);
+    #const res = await fetch('/tiles/3/1/2.json.gz', { mode: 'cors' });
+    #const ds = res.body.pipeThrough(new DecompressionStream('gzip'));
+    #const text = await new Response(ds).text();
+    #const geojson = JSON.parse(text);
+    #console.log(geojson); 
+    #created += 1
+
+    # Save compressed tile to reduce disk/network size
+    if orjson is not None:
+        data = orjson.dumps(geojson)
+    else:
+        data = json.dumps(geojson, separators=(",", ":")).encode()
+    if tile_cctx is not None:
+        return tile_cctx.compress(data)
+    return gzip.compress(data, compresslevel=6)
 
 # generate geojson 
 
 if GENERATE_VECTORTILES:
-
+    created = run_tiles(render_vector_tile, tiles_dir, TILE_EXT, "json")
     for zoom in zoom_levels:
-        print(f"Generating tiles for zoom level {zoom}...")
-        zoom_dir = tiles_dir / str(zoom)
-        zoom_dir.mkdir(exist_ok=True)
-        
-        # Determine tile range covering the data by checking all four corners
-        tx1, ty1 = latlon_to_tile(global_lat_min, global_lon_min, zoom)
-        tx2, ty2 = latlon_to_tile(global_lat_min, global_lon_max, zoom)
-        tx3, ty3 = latlon_to_tile(global_lat_max, global_lon_min, zoom)
-        tx4, ty4 = latlon_to_tile(global_lat_max, global_lon_max, zoom)
-        min_x = min(tx1, tx2, tx3, tx4)
-        max_x = max(tx1, tx2, tx3, tx4)
-        min_y = min(ty1, ty2, ty3, ty4)
-        max_y = max(ty1, ty2, ty3, ty4)
-        
-        created = 0
-        for tx in range(min_x, max_x + 1):
-            x_dir = zoom_dir / str(tx)
-            x_dir.mkdir(exist_ok=True)
-            
-            for ty in range(min_y, max_y + 1):
-                # Get tile bounds
-                tlat_min, tlon_min, tlat_max, tlon_max = tile_bounds(tx, ty, zoom)
-                
-                # boolean mask of points in tile (vectorized)
-                in_tile = ((lats >= tlat_min) & (lats <= tlat_max) &
-                        (lons >= tlon_min) & (lons <= tlon_max) &
-                        ~mask_all)
-                
-                idx = np.flatnonzero(in_tile)
-                N = idx.size
-                if N == 0:
-                    continue
-                
-                # If too many points, pick a deterministic random subset for even spread
-                if N > MAX_FEATURES_PER_TILE:
-                    keep = TARGET_FEATURES_PER_TILE
-                    seed = ((zoom & 0xFFFF) << 32) ^ ((tx & 0xFFFF) << 16) ^ (ty & 0xFFFF)
-                    rng = np.random.default_rng(seed)
-                    choose = rng.choice(idx, size=keep, replace=False)
-                else:
-                    choose = idx  # use all
-                
-                # Convert flat indices back to 2D indices for fast indexing
-                rows, cols = np.unravel_index(choose, lats.shape)
-                tile_lats = lats[rows, cols]
-                tile_lons = lons[rows, cols]
-                tile_u = u_data[rows, cols]
-                tile_v = v_data[rows, cols]
-                tile_speed = speed[rows, cols]
-                
-                # Build features with reduced precision to save space
-                features = []
-                for i in range(tile_lats.size):
-                    feature = {
-                        "type": "Feature",
-                        "geometry": {
-                            "type": "Point",
-                            "coordinates": [
-                                round(float(tile_lons[i]), LAT_LON_PREC),
-                                round(float(tile_lats[i]), LAT_LON_PREC),
-                            ],
-                        },
-                        "properties": {
-                            "u": round(float(tile_u[i]), VEL_PREC),
-                            "v": round(float(tile_v[i]), VEL_PREC),
-                            "speed": round(float(tile_speed[i]), VEL_PREC),
-                            "direction": round(float(math.degrees(math.atan2(tile_v[i], tile_u[i]))), DIR_PREC),
-                        },
-                    }
-                    features.append(feature)
-                
-                geojson = {"type": "FeatureCollection", "features": features}
-
-
-                # Decompress in browser:
-                #// Browser-friendly decompression: DecompressionStream if available (Chromium/Firefox and recent Safari),
-                #// otherwise fall back to inflating the ArrayBuffer client-side (e.g. with pako).
-                #// Include pako on the page if you need the fallback:
-                #// <script src="https://cdn.jsdelivr.net/npm/pako@2/dist/pako.min.js"></script>
-                #//
-                #// Example usage in JS:
-                #// async function fetchGzJson(url) {
-                #//   const res = await fetch(url, { mode: 'cors' });
-                #//   if ('DecompressionStream' in self) {
-                #//     // Modern browsers (Chromium, Firefox, and recent Safari)
-                #//     const ds = res.body.pipeThrough(new DecompressionStream('gzip'));
-                #//     const text = await new Response(ds).text();
-                #//     return JSON.parse(text);
-                #//   } else {
-                #//     // Fallback for older Safari / browsers without DecompressionStream
-                #//     const buf = await res.arrayBuffer();
-                #//     // pako must be available (via CDN or bundled)
-                #//     const inflated = pako.inflate(new Uint8Array(buf), { to: 'string' });
-                #//     return JSON.parse(inflated);
-                #//   }
-                #// }
-                #//
-                #// // call it:
-                #// fetchGzJson('/tiles/3/1/2.json.gz').then(geojson => console.log(geojson)).catch(console.error);
-                #const res = await fetch('/tiles/3/1/2.json.gz', { mode: 'cors' });
-                #const ds = res.body.pipeThrough(new DecompressionStream('gzip'));
-                #const text = await new Response(ds).text();
-                #const geojson = JSON.parse(text);
-                #console.log(geojson); 
-                #created += 1
-                
-                # Save compressed tile to reduce disk/network size
-                tile_file = x_dir / f"{ty}.json.gz"
-                with gzip.open(tile_file, "wt", compresslevel=6) as f:
-                    json.dump(geojson, f, separators=(",", ":"))
-                
-                created += 1
-        
-        total_files = len(list(zoom_dir.rglob("*.json.gz")))
-        print(f"  Generated {total_files} tiles (created this zoom: {created})")
-
-    print(f"Wind barb tiles saved to {tiles_dir}/ (compressed .json.gz files)")
+        total_files = tile_count(created, tiles_dir, TILE_EXT, zoom)
+        print(f"  Zoom {zoom}: generated {total_files} tiles (created this zoom: {created[zoom]})")
+
+    if WRITE_MBTILES:
+        print(f"Wind barb tiles saved to {tiles_dir.with_suffix('.mbtiles')} (compressed {TILE_EXT} tiles)")
+    else:
+        print(f"Wind barb tiles saved to {tiles_dir}/ (compressed {TILE_EXT} files)")
+
+
+# Raster tiles are drawn directly into a numpy RGBA buffer (no matplotlib figure
+# per tile). Sizes mimic the former matplotlib rendering at 100 dpi.
+TILE_PX = 256
+DPI = 100.0                 # pixels per inch, converts point sizes to pixels
+SPEED_DOT_PX = 2            # side of the square speed markers (scatter s=3)
+BARB_RGBA = (0, 0, 0, 255)
+
+# viridis colour table for the speed background
+viridis_lut = (plt.get_cmap("viridis")(np.linspace(0.0, 1.0, 256)) * 255).astype(np.uint8)
+
+_barb_cache = {}
+
+def barb_outline(n_flags, n_barbs, half_barb, length):
+    """Barb polygon in staff coordinates (x across, y along the staff), pivot middle.
+
+    Same construction as matplotlib's Barbs: flags are triangles, barbs are
+    degenerate spikes and the closing edge draws the staff.
+    """
+    key = (n_flags, n_barbs, half_barb, length)
+    if key in _barb_cache:
+        return _barb_cache[key]
+    spacing = length * 0.125
+    height = length * 0.4
+    width = length * 0.25
+    endy = -length / 2.0
+    verts = [(0.0, endy)]
+    offset = length
+    for _ in range(n_flags):
+        if offset != length:
+            offset += spacing / 2.0
+        verts += [(0.0, endy + offset), (height, endy - width / 2 + offset), (0.0, endy - width + offset)]
+        offset -= width + spacing
+    for _ in range(n_barbs):
+        verts += [(0.0, endy + offset), (height, endy + offset + width / 2), (0.0, endy + offset)]
+        offset -= spacing
+    if half_barb:
+        if offset == length:
+            verts.append((0.0, endy + offset))
+            offset -= 1.5 * spacing
+        verts += [(0.0, endy + offset), (height / 2, endy + offset + width / 4), (0.0, endy + offset)]
+    outline = np.array(verts)
+    _barb_cache[key] = outline
+    return outline
+
+def _paint_speed_squares_np(canvas, px, py, level, lut):
+    """Paint a SPEED_DOT_PX square per point, coloured lut[level] (level in 0..255)"""
+    colors = lut[np.clip(level, 0, 255).astype(np.uint8)]
+    x0 = np.clip(px - SPEED_DOT_PX / 2, 0, TILE_PX - 1).astype(np.int32)
+    y0 = np.clip(py - SPEED_DOT_PX / 2, 0, TILE_PX - 1).astype(np.int32)
+    for dy in range(SPEED_DOT_PX):
+        for dx in range(SPEED_DOT_PX):
+            canvas[np.minimum(y0 + dy, TILE_PX - 1), np.minimum(x0 + dx, TILE_PX - 1)] = colors
+
+def _paint_speed_squares_loop(canvas, px, py, level, lut):
+    """Same as _paint_speed_squares_np as explicit loops, compiled by numba without temporaries.
+    Same write order, so overlapping squares end up with the same colour."""
+    last = TILE_PX - 1
+    for dy in range(SPEED_DOT_PX):
+        for dx in range(SPEED_DOT_PX):
+            for i in range(px.size):
+                x = min(max(px[i] - SPEED_DOT_PX / 2, 0.0), last)
+                y = min(max(py[i] - SPEED_DOT_PX / 2, 0.0), last)
+                c = int(min(max(level[i], 0.0), 255.0))
+                canvas[min(int(y) + dy, last), min(int(x) + dx, last), :] = lut[c]
+
+if njit is not None:
+    # no parallel=True: tiles are already rendered one per worker process
+    paint_speed_squares = njit(cache=True, fastmath=True)(_paint_speed_squares_loop)
+else:
+    paint_speed_squares = _paint_speed_squares_np
+
+def rasterize_tile(tile_lons, tile_lats, tile_u, tile_v, tile_speed, bounds, barb_length):
+    """Render speed squares and wind barbs for one tile into a transparent RGBA image."""
+    tlat_min, tlon_min, tlat_max, tlon_max = bounds
+
+    # pixel position of every point (row 0 is the northern tile edge)
+    px = (tile_lons - tlon_min) / (tlon_max - tlon_min) * TILE_PX
+    py = (tlat_max - tile_lats) / (tlat_max - tlat_min) * TILE_PX
+
+    # background: speed squares coloured with a per-tile normalized viridis scale
+    canvas = np.zeros((TILE_PX, TILE_PX, 4), dtype=np.uint8)
+    s_min = tile_speed.min()
+    s_rng = tile_speed.max() - s_min
+    level = (tile_speed - s_min) / s_rng * 255 if s_rng > 0 else np.zeros_like(tile_speed)
+    paint_speed_squares(canvas, px, py, level, viridis_lut)
+
+    img = Image.fromarray(canvas, "RGBA")
+    draw = ImageDraw.Draw(img)
+
+    # barbs: rounded to 5 m/s, flag = 50, barb = 10, half barb = 5 (matplotlib defaults)
+    mag = 5.0 * np.round(np.hypot(tile_u, tile_v) / 5.0)
+    n_flags, mag = np.divmod(mag, 50.0)
+    n_barbs, mag = np.divmod(mag, 10.0)
+    half_barbs = mag >= 5.0
+    n_flags = n_flags.astype(int).tolist()
+    n_barbs = n_barbs.astype(int).tolist()
+    half_barbs = half_barbs.tolist()
+
+    # matplotlib scales the barb polygon by sqrt(length**2 / 4) points
+    length = barb_length * (barb_length / 2.0) * DPI / 72.0
+
+    # staff points upwind, barbs on its left: rotate staff coordinates per point
+    theta = np.arctan2(tile_v, tile_u)
+    cos_t = np.cos(theta).tolist()
+    sin_t = np.sin(theta).tolist()
+    empty_rad = length * 0.15
+    for i, (cx, cy) in enumerate(zip(px.tolist(), py.tolist())):
+        if not (n_flags[i] or n_barbs[i] or half_barbs[i]):
+            draw.ellipse((cx - empty_rad, cy - empty_rad, cx + empty_rad, cy + empty_rad), outline=BARB_RGBA)
+            continue
+        outline = barb_outline(n_flags[i], n_barbs[i], half_barbs[i], length)
+        a, b = outline[:, 0], outline[:, 1]
+        xs = cx - a * sin_t[i] - b * cos_t[i]
+        ys = cy - (a * cos_t[i] - b * sin_t[i])
+        draw.polygon(list(zip(xs.tolist(), ys.tolist())), fill=BARB_RGBA, outline=BARB_RGBA)
+    return img
+
+
+def render_raster_tile(task):
+    zoom, tx, ty, start, end = task
+    tile_lats, tile_lons, tile_u, tile_v, tile_speed = tile_points(task)
+
+    # barb length tuned by zoom (larger zoom -> longer barbs)
+    barb_length = 6 + max(0, zoom - 4)
+    img = rasterize_tile(tile_lons, tile_lats, tile_u, tile_v, tile_speed,
+                         tile_bounds(tx, ty, zoom), barb_length)
+
+    # encode in memory, one write per tile file
+    png_buf = io.BytesIO()
+    img.save(png_buf, format="PNG", optimize=False, compress_level=1)
+    return png_buf.getvalue()
 
 
 if GENERATE_RASTERTILES:
     # Generate raster PNG tiles with wind barbs (256x256 px tiles) in "raster_tiles" directory
-    raster_dir = Path("raster_tiles")
-    raster_dir.mkdir(exist_ok=True)
-
-    TILE_PX = 256
-    DPI = 100.0
-
+    if njit is not None:
+        # compile once here, forked workers inherit the compiled kernel
+        paint_speed_squares(np.zeros((TILE_PX, TILE_PX, 4), dtype=np.uint8), np.zeros(1), np.zeros(1), np.zeros(1), viridis_lut)
+    created = run_tiles(render_raster_tile, raster_dir, ".png", "png")
     for zoom in zoom_levels:
-        print(f"Generating raster tiles for zoom level {zoom}...")
-        zoom_dir = raster_dir / str(zoom)
-        zoom_dir.mkdir(exist_ok=True)
-
-        # Determine tile range covering the data (same approach as vector generation)
-        tx1, ty1 = latlon_to_tile(global_lat_min, global_lon_min, zoom)
-        tx2, ty2 = latlon_to_tile(global_lat_min, global_lon_max, zoom)
-        tx3, ty3 = latlon_to_tile(global_lat_max, global_lon_min, zoom)
-        tx4, ty4 = latlon_to_tile(global_lat_max, global_lon_max, zoom)
-        min_x = min(tx1, tx2, tx3, tx4)
-        max_x = max(tx1, tx2, tx3, tx4)
-        min_y = min(ty1, ty2, ty3, ty4)
-        max_y = max(ty1, ty2, ty3, ty4)
-
-        created = 0
-        for tx in range(min_x, max_x + 1):
-            x_dir = zoom_dir / str(tx)
-            x_dir.mkdir(exist_ok=True)
-
-            for ty in range(min_y, max_y + 1):
-                # tile bounds
-                tlat_min, tlon_min, tlat_max, tlon_max = tile_bounds(tx, ty, zoom)
-
-                # boolean mask of points in tile
-                in_tile = ((lats >= tlat_min) & (lats <= tlat_max) &
-                        (lons >= tlon_min) & (lons <= tlon_max) &
-                        ~mask_all)
-
-                idx = np.flatnonzero(in_tile)
-                N = idx.size
-                if N == 0:
-                    continue
-
-                # deterministic downsample if too many points
-                if N > MAX_FEATURES_PER_TILE:
-                    keep = TARGET_FEATURES_PER_TILE
-                    seed = ((zoom & 0xFFFF) << 32) ^ ((tx & 0xFFFF) << 16) ^ (ty & 0xFFFF)
-                    rng = np.random.default_rng(seed)
-                    choose = rng.choice(idx, size=keep, replace=False)
-                else:
-                    choose = idx
-
-                rows, cols = np.unravel_index(choose, lats.shape)
-                tile_lats = lats[rows, cols]
-                tile_lons = lons[rows, cols]
-                tile_u = u_data[rows, cols]
-                tile_v = v_data[rows, cols]
-                tile_speed = speed[rows, cols]
-
-                # create figure sized to TILE_PX at DPI
-                fig = plt.figure(figsize=(TILE_PX / DPI, TILE_PX / DPI), dpi=DPI)
-                ax = fig.add_axes([0, 0, 1, 1])
-                ax.set_xlim(tlon_min, tlon_max)
-                ax.set_ylim(tlat_min, tlat_max)
-                ax.axis("off")
-
-                # background: small colored dots for speed (cheap rasterized rendering)
-                # use small square markers to roughly fill pixels
-                ax.scatter(tile_lons, tile_lats, c=tile_speed, cmap="viridis", s=3, marker="s", linewidths=0, rasterized=True)
-
-                # barb length tuned by zoom (larger zoom -> longer barbs)
-                barb_length = 6 + max(0, zoom - 4)
-                ax.barbs(tile_lons, tile_lats, tile_u, tile_v, length=barb_length, linewidth=0.5, pivot="middle", color="k")
-
-                out_file = x_dir / f"{ty}.png"
-                fig.savefig(out_file, dpi=DPI, transparent=True)
-                plt.close(fig)
-
-                created += 1
-
-        total_files = len(list(zoom_dir.rglob("*.png")))
-        print(f"  Generated {total_files} raster tiles (created this zoom: {created})")
-
-    print(f"Raster wind barb tiles saved to {raster_dir}/ (PNG files)")
+        total_files = tile_count(created, raster_dir, ".png", zoom)
+        print(f"  Zoom {zoom}: generated {total_files} raster tiles (created this zoom: {created[zoom]})")
+
+    if WRITE_MBTILES:
+        print(f"Raster wind barb tiles saved to {raster_dir.with_suffix('.mbtiles')}")
+    else:
+        print(f"Raster wind barb tiles saved to {raster_dir}/ (PNG files)")
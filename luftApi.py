@@ -9,10 +9,23 @@ from pytz import timezone
 import sys
 import os
 from requests.utils import requote_uri
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import re
+import collections
 import numpy as np
 import sqlite3
 
+try:
+    import orjson
+except ImportError:  # pandas to_json for the NDJSON outputs, response.json() without ijson
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # whole response parsed with orjson or response.json()
+    ijson = None
+
 
 #const API_URL = 'https://api.sensor.community/static/v1/data.json';	// URL to API on 'luftdaten.info'
 #const API24_URL = 'https://api.luftdaten.info/static/v2/data.24h.json';	// URL to API on 'luftdaten.info'
@@ -33,11 +46,28 @@ DB_NAME = "data/radiation.db" # sqlite3
 
 TZ = timezone('Europe/Berlin')
 
+def parse_json_list(response):
+    # parse the top level JSON array incrementally from a stream=True response,
+    # so the raw payload and its decoded text are never held in memory
+    if ijson is None:
+        if orjson is None:
+            return response.json()
+        # whole body at once, but orjson parses the bytes without decoding them to str first
+        try:
+            return orjson.loads(response.content)
+        except orjson.JSONDecodeError as e:
+            raise requests.RequestException(f"invalid JSON in response: {e}") from e
+    response.raw.decode_content = True  # undo gzip/deflate content encoding
+    try:
+        return list(ijson.items(response.raw, 'item', use_float=True))
+    except Exception as e:
+        raise requests.RequestException(f"invalid JSON in response: {e}") from e
+
 def fetch_sensor_data():
     try:
-        response = requests.get(API_URL)
-        response.raise_for_status()  # Raise an error for bad status codes
-        data = response.json()
+        with requests.get(API_URL, stream=True) as response:
+            response.raise_for_status()  # Raise an error for bad status codes
+            data = parse_json_list(response)
         return data
     except requests.RequestException as e:
         print(f"Error fetching data from API: {e}")
@@ -74,57 +104,109 @@ def findItemsAndManufacturers(data):
     measurement_items = set()
     manufacturers = set()
     types = set()
+    add_item, add_manufacturer, add_type = measurement_items.add, manufacturers.add, types.add
 
     for s in data:
         # collect measurement item types
         for m in s.get('sensordatavalues', []):
             vt = m.get('value_type')
             if vt:
-                measurement_items.add(vt)
+                add_item(vt)
+
+        sensor = s.get('sensor') or {}
+        sensor_type = sensor.get('sensor_type') or {}
+        # collect manufacturer information from common possible locations (later ones take precedence)
+        top_type = s.get('sensor_type')
+        manu = ((top_type.get('manufacturer') if isinstance(top_type, dict) else None)
+                or sensor.get('manufacturer') or sensor_type.get('manufacturer'))
+        if manu:
+            add_manufacturer(manu)
+        type_name = sensor_type.get('name')
+        if type_name:
+            add_type(type_name)
+
+    return sorted(measurement_items), sorted(manufacturers), sorted(types)
+
+FLAT_BASE_KEYS = ["file_id", "sensor_id", "timestamp", "latitude", "longitude", "sensor_type", "manufacturer"]
+
+def _appendBaseColumns(columns, s):
+    # append the base fields of one reading, returns its sensor and sensor_type dicts
+    sensor = s.get('sensor', {})
+    sensor_type = sensor.get('sensor_type', {})
+    location = s.get('location', {})
+    columns["file_id"].append(s.get('id', 'N/A'))
+    columns["sensor_id"].append(sensor.get('id', 'N/A'))
+    columns["timestamp"].append(s.get('timestamp', 'N/A'))
+    columns["latitude"].append(location.get('latitude', 'N/A'))
+    columns["longitude"].append(location.get('longitude', 'N/A'))
+    columns["sensor_type"].append(sensor_type.get('name', 'N/A'))
+    columns["manufacturer"].append(sensor_type.get('manufacturer', 'N/A'))
+    return sensor, sensor_type
+
+def _itemFrame(columns, value_maps, items, missing):
+    # add one column per measurement item to the base columns and build the frame
+    # do not allow measurement items to overwrite reserved base fields (e.g. timestamp/latitude),
+    # filtered once for all readings
+    reserved_keys = frozenset(FLAT_BASE_KEYS)
+    for item in dict.fromkeys(items):
+        if item not in reserved_keys:
+            columns[item] = [value_map.get(item, missing) for value_map in value_maps]
+    return pd.DataFrame(columns)
+
+def flattenData(data,items = []):
+    # build the frame column-wise (dict of lists), much cheaper than a DataFrame from a list of row dicts
+    if not data:
+        return pd.DataFrame([])
+    # build a map of available measurements for each sensor
+    value_maps = [{m.get('value_type'): m.get('value') for m in s.get('sensordatavalues', []) if m.get('value_type')}
+                  for s in data]
+    # decide which items to use: provided master list if given, otherwise all items present, in order of appearance
+    # (readings without an item get 'N/A' with a master list, NaN otherwise)
+    if items:
+        missing = 'N/A'
+    else:
+        items = list(dict.fromkeys(k for value_map in value_maps for k in value_map))
+        missing = np.nan
 
-        # collect manufacturer information from common possible locations
-        manu = None
-        manu = s.get('sensor', {}).get('sensor_type', {}).get('manufacturer') or manu
-        manu = s.get('sensor', {}).get('manufacturer') or manu
-        manu = (s.get('sensor_type', {}) if isinstance(s.get('sensor_type'), dict) else {}).get('manufacturer') or manu
+    columns = {k: [] for k in FLAT_BASE_KEYS}
+    for s in data:
+        _appendBaseColumns(columns, s)
+    return _itemFrame(columns, value_maps, items, missing)
+
+def flattenAndFindItems(data):
+    # same as findItemsAndManufacturers(data) followed by flattenData(data, measurement_list),
+    # in a single walk over the readings; returns df, measurement_list, manufacturer_list, type_list
+    if not data:
+        return pd.DataFrame([]), [], [], []
+    measurement_items = set()
+    manufacturers = set()
+    types = set()
+    value_maps = []
+    columns = {k: [] for k in FLAT_BASE_KEYS}
+    for s in data:
+        value_map = {m.get('value_type'): m.get('value') for m in s.get('sensordatavalues', []) if m.get('value_type')}
+        value_maps.append(value_map)
+        measurement_items.update(value_map)
+
+        sensor, sensor_type = _appendBaseColumns(columns, s)
+        # manufacturer from common possible locations, same precedence as findItemsAndManufacturers
+        top_type = s.get('sensor_type')
+        manu = ((top_type.get('manufacturer') if isinstance(top_type, dict) else None)
+                or sensor.get('manufacturer') or sensor_type.get('manufacturer'))
         if manu:
             manufacturers.add(manu)
-        type_name = s.get('sensor', {}).get('sensor_type', {}).get('name')
+        type_name = sensor_type.get('name')
         if type_name:
             types.add(type_name)
 
-    return list(sorted(measurement_items)), list(sorted(manufacturers)), list(sorted(types)) 
+    measurement_list = sorted(measurement_items)
+    df = _itemFrame(columns, value_maps, measurement_list, 'N/A')
+    return df, measurement_list, sorted(manufacturers), sorted(types)
 
-def flattenData(data,items = []):
-    records = []
-    for s in data:
-        base_info = {
-            "file_id": s.get('id', 'N/A'),
-            'sensor_id': s.get('sensor', {}).get('id', 'N/A'),
-            'timestamp': s.get('timestamp', 'N/A'),
-            'latitude': s.get('location', {}).get('latitude', 'N/A'),
-            'longitude': s.get('location', {}).get('longitude', 'N/A'),
-            'sensor_type': s.get('sensor', {}).get('sensor_type', {}).get('name', 'N/A'),
-            'manufacturer': s.get('sensor', {}).get('sensor_type', {}).get('manufacturer', 'N/A')
-        }
-        # build a map of available measurements for this sensor
-        value_map = {m.get('value_type'): m.get('value') for m in s.get('sensordatavalues', []) if m.get('value_type')}
-        # decide which items to iterate: use provided master list if given, otherwise use items present in this reading
-        current_items = items if items else list(value_map.keys())
-        record = base_info.copy()
-        # do not allow measurement items to overwrite reserved base fields (e.g. timestamp/latitude)
-        reserved_keys = set(base_info.keys())
-        for item in current_items:
-            if item in reserved_keys:
-                # preserve the base_info value for this key
-                continue
-            record[item] = value_map.get(item, 'N/A')
-        records.append(record)
-    return pd.DataFrame(records)
-
-def fetch_sensor_data_filtered(sensor_type, country=None, timeout=10):
+def fetch_sensor_data_filtered(sensor_type, country=None, timeout=10, session=None):
     """
     Fetch sensor data filtered by sensor_type (string or list) and optional country (string or list).
+    Pass a requests.Session to reuse its pooled connections.
     Returns parsed JSON list on success or None on failure.
     """
 
@@ -157,15 +239,30 @@ def fetch_sensor_data_filtered(sensor_type, country=None, timeout=10):
     }
 
     try:
-        resp = requests.get(url, headers=headers, timeout=timeout)
-        resp.raise_for_status()
-        return resp.json()
+        with (session or requests).get(url, headers=headers, timeout=timeout, stream=True) as resp:
+            resp.raise_for_status()
+            return parse_json_list(resp)
     except requests.RequestException as e:
         print(f"Error fetching filtered data from API: {e}")
         return None
 
-def makeRadiationSchema(columns):
-    # build a small schema describing each relevant column for later SQL table creation
+def writeRecordsJson(df, path):
+    # write df as newline delimited JSON records, like df.to_json(orient='records', lines=True)
+    if orjson is None:
+        df.to_json(path, orient='records', lines=True, force_ascii=False)
+        return
+    cols = list(df.columns)
+    opts = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE
+    with open(path, 'wb') as f:
+        for row in df.itertuples(index=False, name=None):
+            f.write(orjson.dumps(dict(zip(cols, row)), option=opts))
+
+def makeRadiationSchema(df, columns=None):
+    # build a small schema describing each relevant column of df for later SQL table creation
+    if columns is None:
+        columns = list(df.columns)
+    # numeric-like text columns are detected on a small sample instead of coercing the whole column
+    sample = df.head(1000)
     schema = []
     for idx, col in enumerate(columns):
         col_type = "text"
@@ -175,15 +272,15 @@ def makeRadiationSchema(columns):
         else:
             # use pandas dtype heuristics first
             try:
-                if pd.api.types.is_numeric_dtype(df_rad_relevant[col].dtype):
+                if pd.api.types.is_numeric_dtype(df[col].dtype):
                     col_type = "number"
-                elif pd.api.types.is_datetime64_any_dtype(df_rad_relevant[col].dtype):
+                elif pd.api.types.is_datetime64_any_dtype(df[col].dtype):
                     col_type = "timestamp"
                 else:
                     # try coercion to numeric to detect numeric-like text columns
-                    coerced = pd.to_numeric(df_rad_relevant[col], errors="coerce")
-                    if coerced.notna().sum() > 0 and coerced.notna().sum() >= len(df_rad_relevant) * 0.5:
-                        # treat as number if at least half the values coerce to numeric
+                    coerced = pd.to_numeric(sample[col].dropna().head(50), errors="coerce")
+                    if len(coerced) > 0 and coerced.notna().mean() >= 0.5:
+                        # treat as number if at least half the sampled values coerce to numeric
                         col_type = "number"
             except Exception:
                 col_type = "text"
@@ -196,6 +293,8 @@ def makeRadiationSchema(columns):
 
 
 if __name__ == "__main__":
+    # all outputs go below data/
+    os.makedirs('data', exist_ok=True)
     if 'test' in sys.argv[1:]:
         try:
             print("Running in test mode, reading data from mist.json")
@@ -214,7 +313,8 @@ if __name__ == "__main__":
     if not sensor_data:
         print("No sensor data available to extract lists.")
     else:
-        measurement_list, manufacturer_list, type_list = findItemsAndManufacturers(sensor_data)   
+        # discover items/manufacturers/types and flatten the readings in one pass
+        df, measurement_list, manufacturer_list, type_list = flattenAndFindItems(sensor_data)   
         
         print(f"\nFound {len(measurement_list)} unique measurement items:")
         for item in measurement_list:
@@ -229,7 +329,6 @@ if __name__ == "__main__":
             print(f" - {t}")
 
         # optionally save lists for later use
-        os.makedirs('data', exist_ok=True)
         with open('data/measurement_items.json', 'w', encoding='utf-8') as f:
             json.dump(measurement_list, f, ensure_ascii=False, indent=2)
         with open('data/manufacturers.json', 'w', encoding='utf-8') as f:
@@ -237,20 +336,21 @@ if __name__ == "__main__":
         with open('data/sensor_types.json', 'w', encoding='utf-8') as f:
             json.dump(type_list, f, ensure_ascii=False, indent=2)   
             
-        # flatten data into a DataFrame
-        df = flattenData(sensor_data, measurement_list)
+        # flattened data as DataFrame
         print(f"\nFlattened data into DataFrame with {len(df)} records.")
         print(df.head())
-        df.to_json('data/flattened_sensor_data.json', orient='records', lines=True)
+        writeRecordsJson(df, 'data/flattened_sensor_data.json')
         # save rows for manufacturer "EcoCurious" into separate file
         target = "EcoCurious".strip().lower()
-        mask = df['manufacturer'].astype(str).str.strip().str.lower() == target
+        # normalize the (few dozen) distinct manufacturer names only, then compare category codes
+        manufacturer = df['manufacturer'].astype('category')
+        cats = manufacturer.cat.categories.astype(str).str.strip().str.lower()
+        mask = manufacturer.cat.codes.isin(np.flatnonzero(cats == target))
         df_ecocurious = df[mask]
 
         if not df_ecocurious.empty:
-            os.makedirs('data', exist_ok=True)
             df_ecocurious.sort_values(by=['sensor_id', 'timestamp'], inplace=True) 
-            df_ecocurious.to_json('data/ecocurious.json', orient='records', lines=True, force_ascii=False)
+            writeRecordsJson(df_ecocurious, 'data/ecocurious.json')
             df_ecocurious.to_csv('data/ecocurious.csv', index=False)
             print(f"Wrote {len(df_ecocurious)} records for manufacturer 'EcoCurious' to data/ecocurious.json and data/ecocurious.csv")
         else:
@@ -259,20 +359,25 @@ if __name__ == "__main__":
         # radion sensors: use all types starting with radiation
         radSensors = [t for t in type_list if t.lower().startswith('radiation')]
         print(f"\nFound {len(radSensors)} radiation sensor types:")
-        rad = []
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+        # the filter API takes a comma separated type list: one request for all types
+        rad = fetch_sensor_data_filtered(sensor_type=radSensors, session=session) if radSensors else [] # , country='DE')
+        if rad is None:
+            # combined request failed, fetch the types concurrently over the pooled session instead
+            with ThreadPoolExecutor(max_workers=8) as ex:
+                results = list(ex.map(lambda rs: fetch_sensor_data_filtered(sensor_type=rs, session=session), radSensors)) # , country='DE')
+            rad = [rec for r in results if r for rec in r]
+        fetched = collections.Counter(rec.get('sensor', {}).get('sensor_type', {}).get('name') for rec in rad)
         for rs in radSensors:
             print(f" - {rs}")                   
-            r = fetch_sensor_data_filtered(sensor_type=rs) # , country='DE')
-            print(f"  Fetched {len(r) if r else 0} records for sensor type '{rs}'.")
-            if r:
-                rad.extend(r)
+            print(f"  Fetched {fetched[rs]} records for sensor type '{rs}'.")
         if len(rad) > 0:
             print(f"\nFetched {len(rad)} records for filtered sensor data (Radiation).")
             # flatten and write to file radiation.csv/json
             df_rad = flattenData(rad, measurement_list)
-            os.makedirs('data', exist_ok=True)
             df_rad.sort_values(by=['sensor_id', 'timestamp'], inplace=True) 
-            df_rad.to_json('data/radiation.json', orient='records', lines=True, force_ascii=False)
+            writeRecordsJson(df_rad, 'data/radiation.json')
             df_rad.to_csv('data/radiation.csv', index=False)
             print(f"Wrote {len(df_rad)} records for radiation sensors to data/radiation.json and data/radiation.csv")
             # pick relevant columns (keep only ones that exist)
@@ -295,10 +400,8 @@ if __name__ == "__main__":
             df_rad_relevant = df_rad[relevant_cols].copy()
 
             # convert measurement columns to numeric
-            df_rad_relevant[count_col] = pd.to_numeric(df_rad_relevant[count_col], errors='coerce')
-            df_rad_relevant[count_per_min_col] = pd.to_numeric(df_rad_relevant[count_per_min_col], errors='coerce')
-            df_rad_relevant["hv_pulses"] = pd.to_numeric(df_rad_relevant["hv_pulses"], errors='coerce')
-            df_rad_relevant["sample_time_ms"] = pd.to_numeric(df_rad_relevant["sample_time_ms"], errors='coerce')
+            numeric_cols = [count_col, count_per_min_col, "hv_pulses", "sample_time_ms"]
+            df_rad_relevant[numeric_cols] = df_rad_relevant[numeric_cols].apply(pd.to_numeric, errors='coerce')
 
             # prefer using count per minute if available
             if count_per_min_col is None and count_col is not None:
@@ -312,12 +415,15 @@ if __name__ == "__main__":
                 # keep only rows with non-null, non-negative and non-zero values
                 mask_nonneg = df_rad_relevant[count_per_min_col].notnull() & (df_rad_relevant[count_per_min_col] >= 0)
                 mask_pos = df_rad_relevant[count_per_min_col] > 0
-                df_nonneg = df_rad_relevant[mask_nonneg].copy()
-                df_pos = df_rad_relevant[mask_pos].copy()
+                df_nonneg = df_rad_relevant[mask_nonneg]
+                df_pos = df_rad_relevant[mask_pos]
 
                 # mean count per minute per sensor (only using strictly positive values)
-                per_sensor_mean = df_pos.groupby("sensor_id")[count_per_min_col].mean().reset_index(name="mean_count_per_min")
-                overall_mean_all_measurements = df_pos[count_per_min_col].mean() if not df_pos.empty else np.nan
+                # one grouped pass gives per-sensor sum/count; both overall means derive from it
+                per_sensor = df_pos.groupby("sensor_id", sort=False)[count_per_min_col].agg(["sum", "count"])
+                per_sensor_mean = (per_sensor["sum"] / per_sensor["count"]).sort_index().reset_index(name="mean_count_per_min")
+                total_count = per_sensor["count"].sum()
+                overall_mean_all_measurements = per_sensor["sum"].sum() / total_count if total_count > 0 else np.nan
                 overall_mean_per_sensor = per_sensor_mean["mean_count_per_min"].mean() if not per_sensor_mean.empty else np.nan
 
                 # compute evaluation column based on count_per_min relative to mean
@@ -339,14 +445,13 @@ if __name__ == "__main__":
                 print(f"Overall mean (mean of per-sensor means): {overall_mean_per_sensor}")
 
                 # optionally save results
-                os.makedirs("data", exist_ok=True)
                 df_rad_relevant.to_csv("data/radiation_relevant.csv", index=False)
                 per_sensor_mean.to_csv("data/radiation_per_sensor_mean_cpm.csv", index=False)
 
                 schema_path = "data/radiation_relevant_schema.json"
                 if not os.path.exists(schema_path):
                     try:
-                        makeRadiationSchema(list(df_rad_relevant.columns))
+                        makeRadiationSchema(df_rad_relevant)
                         print(f"Created radiation schema: {schema_path}")
                     except Exception as e:
                         print(f"Error creating radiation schema: {e}")
@@ -355,13 +460,20 @@ if __name__ == "__main__":
                 os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
                 conn = sqlite3.connect(db_path)
+                # bulk import settings: WAL journal without fsync per commit, temp data and 64 MB page cache in memory
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("PRAGMA temp_store=MEMORY")
+                conn.execute("PRAGMA cache_size=-65536")
                 cur = conn.cursor()
 
                 # prepare columns and sqlite types based on dataframe dtypes
                 cols = list(df_rad_relevant.columns)
+                # coordinates arrive as text from the API; REAL affinity stores them as numbers
+                real_cols = {"latitude", "longitude", "counts_per_minute"}
                 col_defs = []
                 for c in cols:
-                    if pd.api.types.is_numeric_dtype(df_rad_relevant[c].dtype):
+                    if pd.api.types.is_numeric_dtype(df_rad_relevant[c].dtype) or c in real_cols:
                         typ = "REAL"
                     elif "time" in c.lower() or "date" in c.lower() or c.lower() == "timestamp":
                         typ = "TEXT"
@@ -377,29 +489,32 @@ if __name__ == "__main__":
                 cur.execute(create_sql)
 
                 # build insert statement (use INSERT OR IGNORE to skip existing sensor_id+timestamp)
-                placeholders = ",".join(["?"] * len(cols))
+                # as multi-row VALUES lists, one statement per chunk of rows
+                row_placeholders = "(" + ",".join(["?"] * len(cols)) + ")"
                 col_list = ",".join([f'"{c}"' for c in cols])
-                insert_sql = f'INSERT OR IGNORE INTO radiation_data ({col_list}) VALUES ({placeholders})'
-
-                # prepare rows, converting NaN to None
-                to_insert = []
-                for _, row in df_rad_relevant.iterrows():
-                    vals = []
-                    for c in cols:
-                        v = row[c]
-                        if pd.isna(v):
-                            vals.append(None)
-                        else:
-                            vals.append(v)
-                    to_insert.append(tuple(vals))
-
-                before = cur.execute("SELECT COUNT(*) FROM radiation_data").fetchone()[0]
-                if to_insert:
-                    cur.executemany(insert_sql, to_insert)
-                    conn.commit()
-                after = cur.execute("SELECT COUNT(*) FROM radiation_data").fetchone()[0]
-
-                inserted = after - before
+                insert_sql = f'INSERT OR IGNORE INTO radiation_data ({col_list}) VALUES '
+                # stay below SQLite's bound parameter limit (999 before 3.32, 32766 since)
+                max_params = conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER) if hasattr(conn, "getlimit") else 999
+                rows_per_insert = max(1, min(500, max_params // len(cols)))
+                # statement text for a full chunk built once so sqlite3's statement cache reuses it
+                chunk_sql = insert_sql + ",".join([row_placeholders] * rows_per_insert)
+
+                # prepare rows, converting NaN to None (whole frame at once, object dtype keeps None)
+                clean = df_rad_relevant[cols].astype(object).where(df_rad_relevant[cols].notna(), None)
+                values = clean.to_numpy()
+
+                # total_changes counts only rows actually written, so ignored duplicates are excluded
+                before = conn.total_changes
+                if len(values):
+                    # one explicit write transaction for the whole batch, committed by the context manager
+                    with conn:
+                        cur.execute("BEGIN IMMEDIATE")
+                        for start in range(0, len(values), rows_per_insert):
+                            chunk = values[start:start + rows_per_insert]
+                            sql = chunk_sql if len(chunk) == rows_per_insert else insert_sql + ",".join([row_placeholders] * len(chunk))
+                            cur.execute(sql, chunk.ravel().tolist())
+
+                inserted = conn.total_changes - before
                 print(f"Inserted {inserted} new rows into {db_path} (table radiation_data).")
 
                 conn.close()
@@ -409,56 +524,50 @@ if __name__ == "__main__":
                 conn = sqlite3.connect(db_path)
                 cur = conn.cursor()
 
+                # SQLite takes the bare columns from the MAX(timestamp) row of each group; the
+                # UNIQUE(sensor_id, timestamp) index serves the grouping, so this is one index scan
                 query = """
-                SELECT t.sensor_id, t.sensor_type, t.counts_per_minute, t.latitude, t.longitude, t.timestamp
-                FROM radiation_data t
-                JOIN (
-                    SELECT sensor_id, MAX(timestamp) AS max_ts
-                    FROM radiation_data
-                    GROUP BY sensor_id
-                ) m ON t.sensor_id = m.sensor_id AND t.timestamp = m.max_ts
+                SELECT sensor_id, sensor_type, counts_per_minute, latitude, longitude, MAX(timestamp) AS timestamp
+                FROM radiation_data
+                GROUP BY sensor_id
                 """
                 cur.execute(query)
-                rows = cur.fetchall()
-                cols = [d[0] for d in cur.description] if cur.description else []
-
-                features = []
-                for row in rows:
-                        rec = dict(zip(cols, row))
-                        lat = rec.get("latitude")
-                        lon = rec.get("longitude")
-                        # try to coerce lat/lon to floats; skip if not valid
-                        try:
-                                if lat is None or lon is None:
-                                        continue
-                                lat_f = float(lat)
-                                lon_f = float(lon)
-                        except Exception:
-                                continue
-
-                        properties = {
-                                "sensor_id": rec.get("sensor_id"),
-                                "sensor_type": rec.get("sensor_type"),
-                                # map DB column counts_per_minute -> output property count_per_minute
-                                "count_per_minute": rec.get("counts_per_minute"),
-                                "timestamp": rec.get("timestamp")
-                        }
-
-                        feature = {
-                                "type": "Feature",
-                                "geometry": {"type": "Point", "coordinates": [lon_f, lat_f]},
-                                "properties": properties
-                        }
-                        features.append(feature)
-
-                feature_collection = {"type": "FeatureCollection", "features": features}
-
-                os.makedirs("data", exist_ok=True)
+
+                # stream the features into the file as rows come in, no feature list in memory
+                if orjson is not None:
+                        dumps = orjson.dumps
+                else:
+                        dumps = lambda obj: json.dumps(obj, ensure_ascii=False).encode("utf-8")
                 out_path = os.path.join("data", "radiationLatest.geojson")
-                with open(out_path, "w", encoding="utf-8") as f:
-                        json.dump(feature_collection, f, ensure_ascii=False, indent=2)
+                n_features = 0
+                with open(out_path, "wb") as f:
+                        f.write(b'{"type":"FeatureCollection","features":[')
+                        for sensor_id, sensor_type, counts_per_minute, lat, lon, ts in cur:
+                                # try to coerce lat/lon to floats; skip if not valid
+                                try:
+                                        if lat is None or lon is None:
+                                                continue
+                                        lat_f = float(lat)
+                                        lon_f = float(lon)
+                                except Exception:
+                                        continue
 
-                print(f"Wrote {len(features)} features to {out_path}")
+                                feature = {
+                                        "type": "Feature",
+                                        "geometry": {"type": "Point", "coordinates": [lon_f, lat_f]},
+                                        "properties": {
+                                                "sensor_id": sensor_id,
+                                                "sensor_type": sensor_type,
+                                                # map DB column counts_per_minute -> output property count_per_minute
+                                                "count_per_minute": counts_per_minute,
+                                                "timestamp": ts
+                                        }
+                                }
+                                f.write((b"," if n_features else b"") + dumps(feature))
+                                n_features += 1
+                        f.write(b"]}")
+
+                print(f"Wrote {n_features} features to {out_path}")
 
                 cur.close()
                 conn.close()
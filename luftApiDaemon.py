@@ -10,10 +10,17 @@ from pytz import timezone
 import sys
 import os
 from requests.utils import requote_uri
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import numpy as np
 import sqlite3
 
+try:
+    import orjson
+except ImportError:  # stdlib json / pandas to_json for the response and the outputs
+    orjson = None
+
 # put this line into your crontab (crontab -e) to run every 5 minutes
 # */5 * * * * cd /home/kugel/daten/work/python/openData/luftdaten.info && /usr/bin/python3 /home/kugel/daten/work/python/openData/luftdaten.info/luftApiDaemon.py >> /home/kugel/daten/work/python/openData/luftdaten.info/luftApiDaemon.log 2>&1
 
@@ -23,33 +30,60 @@ DB_NAME = "data/radiation.db" # sqlite3
 
 TZ = timezone('Europe/Berlin')
 
+# one pooled keep-alive session for all filter requests (same host)
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                      max_retries=Retry(total=2, backoff_factor=0.3)))
+session.headers.update({
+    "User-Agent": "luftdaten-fetcher/1.0 (+https://example.org; contact: ops@example.org)"
+})
+
+
+FLAT_BASE_KEYS = ["file_id", "sensor_id", "timestamp", "latitude", "longitude", "sensor_type", "manufacturer"]
+
+def _appendBaseColumns(columns, s):
+    # append the base fields of one reading, returns its sensor and sensor_type dicts
+    sensor = s.get('sensor', {})
+    sensor_type = sensor.get('sensor_type', {})
+    location = s.get('location', {})
+    columns["file_id"].append(s.get('id', 'N/A'))
+    columns["sensor_id"].append(sensor.get('id', 'N/A'))
+    columns["timestamp"].append(s.get('timestamp', 'N/A'))
+    columns["latitude"].append(location.get('latitude', 'N/A'))
+    columns["longitude"].append(location.get('longitude', 'N/A'))
+    columns["sensor_type"].append(sensor_type.get('name', 'N/A'))
+    columns["manufacturer"].append(sensor_type.get('manufacturer', 'N/A'))
+    return sensor, sensor_type
+
+def _itemFrame(columns, value_maps, items, missing):
+    # add one column per measurement item to the base columns and build the frame
+    # do not allow measurement items to overwrite reserved base fields (e.g. timestamp/latitude),
+    # filtered once for all readings
+    reserved_keys = frozenset(FLAT_BASE_KEYS)
+    for item in dict.fromkeys(items):
+        if item not in reserved_keys:
+            columns[item] = [value_map.get(item, missing) for value_map in value_maps]
+    return pd.DataFrame(columns)
 
 def flattenData(data,items = []):
-    records = []
+    # build the frame column-wise (dict of lists), much cheaper than a DataFrame from a list of row dicts
+    if not data:
+        return pd.DataFrame([])
+    # build a map of available measurements for each sensor
+    value_maps = [{m.get('value_type'): m.get('value') for m in s.get('sensordatavalues', []) if m.get('value_type')}
+                  for s in data]
+    # decide which items to use: provided master list if given, otherwise all items present, in order of appearance
+    # (readings without an item get 'N/A' with a master list, NaN otherwise)
+    if items:
+        missing = 'N/A'
+    else:
+        items = list(dict.fromkeys(k for value_map in value_maps for k in value_map))
+        missing = np.nan
+
+    columns = {k: [] for k in FLAT_BASE_KEYS}
     for s in data:
-        base_info = {
-            "file_id": s.get('id', 'N/A'),
-            'sensor_id': s.get('sensor', {}).get('id', 'N/A'),
-            'timestamp': s.get('timestamp', 'N/A'),
-            'latitude': s.get('location', {}).get('latitude', 'N/A'),
-            'longitude': s.get('location', {}).get('longitude', 'N/A'),
-            'sensor_type': s.get('sensor', {}).get('sensor_type', {}).get('name', 'N/A'),
-            'manufacturer': s.get('sensor', {}).get('sensor_type', {}).get('manufacturer', 'N/A')
-        }
-        # build a map of available measurements for this sensor
-        value_map = {m.get('value_type'): m.get('value') for m in s.get('sensordatavalues', []) if m.get('value_type')}
-        # decide which items to iterate: use provided master list if given, otherwise use items present in this reading
-        current_items = items if items else list(value_map.keys())
-        record = base_info.copy()
-        # do not allow measurement items to overwrite reserved base fields (e.g. timestamp/latitude)
-        reserved_keys = set(base_info.keys())
-        for item in current_items:
-            if item in reserved_keys:
-                # preserve the base_info value for this key
-                continue
-            record[item] = value_map.get(item, 'N/A')
-        records.append(record)
-    return pd.DataFrame(records)
+        _appendBaseColumns(columns, s)
+    return _itemFrame(columns, value_maps, items, missing)
 
 def fetch_sensor_data_filtered(sensor_type, country=None, timeout=10):
     """
@@ -73,6 +107,8 @@ def fetch_sensor_data_filtered(sensor_type, country=None, timeout=10):
         country_str = None
 
     # build query part expected by the API: e.g. "type=SDS011,BME280&country=DE,NL"
+    # the filter is a path segment (.../filter/type=...), not a query string, so requests'
+    # params= (which would send ?type=... with escaped commas) cannot be used here
     query_parts = [f"type={type_str}"]
     if country_str:
         query_parts.append(f"country={country_str}")
@@ -80,18 +116,36 @@ def fetch_sensor_data_filtered(sensor_type, country=None, timeout=10):
 
     url = requote_uri(API_BASE + query)
 
-    headers = {
-        "User-Agent": "luftdaten-fetcher/1.0 (+https://example.org; contact: ops@example.org)"
-    }
-
     try:
-        resp = requests.get(url, headers=headers, timeout=timeout)
+        resp = session.get(url, timeout=timeout)
         resp.raise_for_status()
+        if orjson is not None:
+            # parse the raw body bytes directly, no intermediate str
+            return orjson.loads(resp.content)
         return resp.json()
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         print(f"Error fetching filtered data from API: {e}")
         return None
 
+def writeRecordsJson(df, path):
+    # write df as newline delimited JSON records, like df.to_json(orient='records', lines=True)
+    if orjson is None:
+        df.to_json(path, orient='records', lines=True, force_ascii=False)
+        return
+    cols = list(df.columns)
+    opts = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE
+    with open(path, 'wb') as f:
+        for row in df.itertuples(index=False, name=None):
+            f.write(orjson.dumps(dict(zip(cols, row)), option=opts))
+
+def lastMaintenance(cur, task):
+    # (unix time of last run, rows pending) for a maintenance task, (0, 0) if it never ran
+    row = cur.execute("SELECT last_run, pending FROM maintenance WHERE task = ?", (task,)).fetchone()
+    return row if row else (0.0, 0)
+
+def setMaintenance(cur, task, last_run, pending=0):
+    cur.execute("INSERT OR REPLACE INTO maintenance (task, last_run, pending) VALUES (?, ?, ?)", (task, last_run, pending))
+
 
 if __name__ == "__main__":
     with open("data/sensor_types.json", "r") as f:
@@ -125,7 +179,7 @@ if __name__ == "__main__":
         df_sensors = df_rad['sensor_id'].unique()
         print(f"\nUnique sensors in fetched radiation data: {len(df_sensors)}")
         df_rad.sort_values(by=['sensor_id', 'timestamp'], inplace=True) 
-        df_rad.to_json('data/radiation.json', orient='records', lines=True, force_ascii=False)
+        writeRecordsJson(df_rad, 'data/radiation.json')
         df_rad.to_csv('data/radiation.csv', index=False)
         print(f"Wrote {len(df_rad)} records for radiation sensors to data/radiation.json and data/radiation.csv")
         # pick relevant columns (keep only ones that exist)
@@ -146,33 +200,7 @@ if __name__ == "__main__":
         df_rad_relevant = df_rad[relevant_cols].copy()
 
         # convert measurement columns to numeric
-        df_rad_relevant[radiation_cols[0]] = pd.to_numeric(df_rad_relevant[radiation_cols[0]], errors='coerce')
-        df_rad_relevant[radiation_cols[1]] = pd.to_numeric(df_rad_relevant[radiation_cols[1]], errors='coerce')
-        df_rad_relevant["hv_pulses"] = pd.to_numeric(df_rad_relevant["hv_pulses"], errors='coerce')
-        df_rad_relevant["sample_time_ms"] = pd.to_numeric(df_rad_relevant["sample_time_ms"], errors='coerce')
-
-        # keep only rows with non-null, non-negative and non-zero values
-        mask_nonneg = df_rad_relevant[radiation_cols[1]].notnull() & (df_rad_relevant[radiation_cols[1]] >= 0)
-        mask_pos = df_rad_relevant[radiation_cols[1]] > 0
-        df_nonneg = df_rad_relevant[mask_nonneg].copy()
-        df_pos = df_rad_relevant[mask_pos].copy()
-
-        # mean count per minute per sensor (only using strictly positive values)
-        per_sensor_mean = df_pos.groupby("sensor_id")[radiation_cols[1]].mean().reset_index(name="mean_count_per_min")
-        overall_mean_all_measurements = df_pos[radiation_cols[1]].mean() if not df_pos.empty else np.nan
-        overall_mean_per_sensor = per_sensor_mean["mean_count_per_min"].mean() if not per_sensor_mean.empty else np.nan
-
-        # compute evaluation column based on count_per_min relative to mean
-        mean_value = overall_mean_all_measurements
-        if pd.isna(mean_value):
-            # fallback: compute mean from positive values in the reduced dataframe
-            mean_value = df_rad_relevant[radiation_cols[1]][df_rad_relevant[radiation_cols[1]] > 0].mean()
-
-        cpm = df_rad_relevant[radiation_cols[1]]
-
-        cond_neg_or_zero = cpm <= 0
-        cond_less_than_mean = (cpm > 0) & (cpm < mean_value)
-        cond_greater_than_mean = cpm > mean_value
+        df_rad_relevant[radiation_cols] = df_rad_relevant[radiation_cols].apply(pd.to_numeric, errors='coerce')
 
         # check db: throw if DB file does not exist (do not create directories or files here)
         db_path = DB_NAME
@@ -181,57 +209,85 @@ if __name__ == "__main__":
             raise FileNotFoundError(f"Database file not found: {db_path}")
 
         conn = sqlite3.connect(db_path)
+        # WAL journal without fsync per commit, temp data and 64 MB page cache in memory
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")
         cur = conn.cursor()
 
-        # remove all data older than 40 days 
+        # (sensor_id, timestamp) must be unique so INSERT OR IGNORE alone drops duplicates;
+        # tables created by luftApi.py carry the UNIQUE constraint, older ones get an index
+        unique_keys = {
+            tuple(c[2] for c in cur.execute(f'PRAGMA index_info("{idx[1]}")'))
+            for idx in cur.execute("PRAGMA index_list(radiation_data)").fetchall() if idx[2]
+        }
+        if ("sensor_id", "timestamp") not in unique_keys:
+            with conn:
+                # one-off cleanup of duplicates left by earlier runs, keeping the first inserted row
+                cur.execute("DELETE FROM radiation_data WHERE rowid NOT IN (SELECT MIN(rowid) FROM radiation_data GROUP BY sensor_id, timestamp);")
+                print(f"Removed {cur.rowcount} duplicate rows before creating unique index.")
+                cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_rad_sid_ts ON radiation_data(sensor_id, timestamp)")
+
         dayLimit = 40 # keep max of 40 days
-        print(f"Deleting data older than {dayLimit} days from database.")
-        cur.execute(f"DELETE FROM radiation_data WHERE timestamp < datetime('now', '-{dayLimit} days')")
-        conn.commit()
-        cur.execute("VACUUM;")
-        conn.commit()
+        expireInterval = 3600 # seconds between expiry runs, the cron job runs every 5 minutes
+        vacuumInterval = 86400 # seconds between VACUUMs of a db with expired rows
+        vacuumLimit = 10000 # expired rows that trigger a VACUUM before vacuumInterval has passed
+
+        # last run of the maintenance tasks, kept in the db itself
+        cur.execute("CREATE TABLE IF NOT EXISTS maintenance (task TEXT PRIMARY KEY, last_run REAL, pending INTEGER)")
 
         # prepare columns and sqlite types based on dataframe dtypes
         cols = list(df_rad_relevant.columns)
 
         # build insert statement (use INSERT OR IGNORE to skip existing sensor_id+timestamp)
-        placeholders = ",".join(["?"] * len(cols))
+        # as multi-row VALUES lists, one statement per chunk of rows
+        row_placeholders = "(" + ",".join(["?"] * len(cols)) + ")"
         col_list = ",".join([f'"{c}"' for c in cols])
-        insert_sql = f'INSERT OR IGNORE INTO radiation_data ({col_list}) VALUES ({placeholders})'
-
-        # prepare rows, converting NaN to None
-        to_insert = []
-        for _, row in df_rad_relevant.iterrows():
-            vals = []
-            for c in cols:
-                v = row[c]
-                if pd.isna(v):
-                    vals.append(None)
-                else:
-                    vals.append(v)
-            to_insert.append(tuple(vals))
-
-        before = cur.execute("SELECT COUNT(*) FROM radiation_data").fetchone()[0]
-        if to_insert:
-            cur.executemany(insert_sql, to_insert)
-            conn.commit()
-        afterIns = cur.execute("SELECT COUNT(*) FROM radiation_data").fetchone()[0]
-
-        inserted = afterIns - before
-        print(f"Inserted {inserted} new rows into {db_path} (table radiation_data).")
-
-        # ------------------------------------------------------------------
-        # Delete duplicates, keeping the row with the smallest `id`
-        # ------------------------------------------------------------------
-        # The sub‑query finds the minimum id for each (itemId, timestamp) group.
-        # Any row whose id is NOT in that list gets removed.
-        # use sqlite impicit rowid as unique identifier
-        cur.execute("DELETE FROM radiation_data WHERE rowid NOT IN (SELECT MIN(rowid) FROM radiation_data GROUP BY sensor_id, timestamp);")
-        conn.commit()
-
-        afterCln = cur.execute("SELECT COUNT(*) FROM radiation_data").fetchone()[0]
-        deleted = afterIns - afterCln
-        print(f"Left {afterCln} rows after deleting {deleted} in {db_path} (table radiation_data) after removing duplicates.")
+        insert_sql = f'INSERT OR IGNORE INTO radiation_data ({col_list}) VALUES '
+        # stay below SQLite's bound parameter limit (999 before 3.32, 32766 since)
+        max_params = conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER) if hasattr(conn, "getlimit") else 999
+        rows_per_insert = max(1, min(500, max_params // len(cols)))
+        # statement text for a full chunk built once so sqlite3's statement cache reuses it
+        chunk_sql = insert_sql + ",".join([row_placeholders] * rows_per_insert)
+
+        # prepare rows, converting NaN to None (whole frame at once, object dtype keeps None)
+        clean = df_rad_relevant[cols].astype(object).where(df_rad_relevant[cols].notna(), None)
+        values = clean.to_numpy()
+
+        # expiry and insert run as one transaction, committed by the context manager
+        now = time.time()
+        with conn:
+            lastExpire, _ = lastMaintenance(cur, "expire")
+            lastVacuum, pendingVacuum = lastMaintenance(cur, "vacuum")
+            if now - lastExpire >= expireInterval:
+                # remove all data older than 40 days
+                print(f"Deleting data older than {dayLimit} days from database.")
+                cur.execute(f"DELETE FROM radiation_data WHERE timestamp < datetime('now', '-{dayLimit} days')")
+                # expired rows leave free pages behind until the next VACUUM
+                pendingVacuum += cur.rowcount
+                setMaintenance(cur, "expire", now)
+                setMaintenance(cur, "vacuum", lastVacuum, pendingVacuum)
+            else:
+                print(f"Skipping expiry of old data, last run {int(now - lastExpire)} s ago.")
+
+            before = cur.execute("SELECT COUNT(*) FROM radiation_data").fetchone()[0]
+            for start in range(0, len(values), rows_per_insert):
+                chunk = values[start:start + rows_per_insert]
+                sql = chunk_sql if len(chunk) == rows_per_insert else insert_sql + ",".join([row_placeholders] * len(chunk))
+                cur.execute(sql, chunk.ravel().tolist())
+            afterIns = cur.execute("SELECT COUNT(*) FROM radiation_data").fetchone()[0]
+
+            inserted = afterIns - before
+            print(f"Inserted {inserted} new rows into {db_path} (table radiation_data).")
+
+        # VACUUM rewrites the whole file and cannot run inside a transaction: run it once a day
+        # when rows expired, earlier only if many did
+        if pendingVacuum >= vacuumLimit or (pendingVacuum > 0 and now - lastVacuum >= vacuumInterval):
+            print(f"Vacuuming database after removing {pendingVacuum} expired rows.")
+            conn.execute("VACUUM")
+            with conn:
+                setMaintenance(cur, "vacuum", time.time())
 
         conn.close()
 
@@ -299,8 +355,12 @@ if __name__ == "__main__":
 
         os.makedirs("data", exist_ok=True)
         out_path = os.path.join("data", "radiationLatest.geojson")
-        with open(out_path, "w", encoding="utf-8") as f:
-                json.dump(feature_collection, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+                with open(out_path, "wb") as f:
+                        f.write(orjson.dumps(feature_collection, option=orjson.OPT_INDENT_2))
+        else:
+                with open(out_path, "w", encoding="utf-8") as f:
+                        json.dump(feature_collection, f, ensure_ascii=False, indent=2)
 
         print(f"Wrote {len(features)} features to {out_path}")
 
@@ -10,11 +10,28 @@ import re
 import numpy as np
 import sqlite3
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+try:
+    import orjson
+except ImportError:  # stdlib json for the series output
+    orjson = None
+
+# matplotlib is imported by load_matplotlib() only when PNGs are requested (-png)
+plt = None
+mdates = None
+
+
+def load_matplotlib():
+    global plt, mdates
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    # draw long series in chunks (no visible change, bounds the Agg path size)
+    plt.rcParams["agg.path.chunksize"] = 10000
 
 
 DB_NAME = "data/radiation.db" # sqlite3
@@ -22,45 +39,51 @@ DB_NAME = "data/radiation.db" # sqlite3
 TZ = timezone('Europe/Berlin')
 
 
-def resample_and_export(sid, N, RESAMPLE_FREQ):
-    # read rows for this sensor
+def localize(ts):
+    # ensure timestamps are in the configured timezone
+    try:
+        if ts.dt.tz is None:
+            return ts.dt.tz_localize(TZ)
+        return ts.dt.tz_convert(TZ)
+    except Exception:
+        # best-effort localization if above fails
+        return ts.dt.tz_localize(TZ, ambiguous="infer", nonexistent="shift_forward")
+
 
+def read_sensor_series(conn, N):
+    # read the rows of the last N days for all sensors in one query, split per sensor_id;
+    # the SQL cutoff keeps a day of slack for the local timezone, the exact one is applied per series
     df = pd.read_sql_query(
-        "SELECT timestamp, counts_per_minute FROM radiation_data WHERE sensor_id = ? ORDER BY timestamp",
+        "SELECT sensor_id, timestamp, counts_per_minute FROM radiation_data "
+        "WHERE timestamp >= datetime('now', ?) ORDER BY sensor_id, timestamp",
         conn,
-        params=(sid,),
+        params=(f"-{N + 1} days",),
     )
-    if df.empty:
-        return []
 
-    # parse timestamps and drop bad rows
+    # parse timestamps and counts once for all sensors, drop bad rows
     df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
     df = df.dropna(subset=["timestamp"])
-    if df.empty:
-        return []
+    df["counts_per_minute"] = pd.to_numeric(df["counts_per_minute"], errors="coerce")
+
+    # per sensor: localized, time sorted counts_per_minute series, shared by all resample windows
+    series = {}
+    for sid, g in df.groupby("sensor_id", sort=False):
+        s = pd.Series(g["counts_per_minute"].to_numpy(), index=pd.DatetimeIndex(localize(g["timestamp"])), name="counts_per_minute")
+        series[sid] = s.sort_index()
+    return series
 
-    # ensure timestamps are in the configured timezone
-    try:
-        if df["timestamp"].dt.tz is None:
-            df["timestamp"] = df["timestamp"].dt.tz_localize(TZ)
-        else:
-            df["timestamp"] = df["timestamp"].dt.tz_convert(TZ)
-    except Exception:
-        # best-effort localization if above fails
-        df["timestamp"] = df["timestamp"].dt.tz_localize(TZ, ambiguous="infer", nonexistent="shift_forward")
 
+def resample_and_export(cpm, sid, N, RESAMPLE_FREQ):
+    # cpm is the localized counts_per_minute series for this sensor
     # drop old entries older than N days
     cutoff = pd.Timestamp.now(TZ) - pd.Timedelta(days=N)
-    df = df[df["timestamp"] >= cutoff]
-    if df.empty:
+    cpm = cpm[cpm.index >= cutoff]
+    if cpm.empty:
         print(f"No recent data for sensor {sid}, {N}")
         return []
 
-    df = df.sort_values("timestamp").set_index("timestamp")
-
-    # ensure numeric counts and resample to 15-minute bins (mean if multiple in bin)
-    df["counts_per_minute"] = pd.to_numeric(df["counts_per_minute"], errors="coerce")
-    series = df["counts_per_minute"].resample(RESAMPLE_FREQ).mean()
+    # resample to RESAMPLE_FREQ bins (mean if multiple in bin)
+    series = cpm.resample(RESAMPLE_FREQ).mean()
 
     if series.empty or series.isna().all():
         # nothing to save for this sensor
@@ -74,6 +97,59 @@ def resample_and_export(sid, N, RESAMPLE_FREQ):
     return series
     
 
+_plot_figure = None
+
+def plot_series(series, sid, N, out_png):
+    # one figure per process, cleared and redrawn for every plot; figure setup dominates otherwise
+    global _plot_figure
+    if _plot_figure is None:
+        _plot_figure = plt.subplots(figsize=(10, 4))
+    fig, ax = _plot_figure
+    ax.clear()
+    # start from the default margins, tight_layout below refits them for this plot
+    fig.subplots_adjust(**{k: plt.rcParams[f"figure.subplot.{k}"] for k in ("left", "right", "bottom", "top")})
+    ax.plot(series.index, series.values, marker="o", ms=3, lw=1, color="#1f77b4")
+    ax.set_xlabel("time")
+    ax.set_ylabel("counts_per_minute")
+    ax.set_title(f"Sensor {int(sid)} — last {N} days")
+    ax.grid(True, alpha=0.3)
+
+    # pretty time formatting (respect timezone)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d\n%H:%M", tz=TZ))
+    fig.autofmt_xdate()
+
+    fig.tight_layout()
+    fig.savefig(out_png, dpi=150)
+
+
+def process_sensor(enable_png, task):
+    # day and month series (JSON, and PNG for the first sensors) for one sensor
+    i, sid, cpm = task
+    for name, N, freq in (("day", 2, "15min"), ("month", 30, "6h")):
+        data = resample_and_export(cpm, sid, N, freq)
+        if len(data) == 0:
+            return
+        out_path = os.path.join("data", f"series_{name}_{str(int(sid))}.json")
+        write_series_json(out_path, sid, data)
+
+        # also create a PNG plot for first 10 sensors only
+        if enable_png and (i <= 10):
+            if not data.empty:
+                plot_series(data, sid, N, os.path.join("data", f"series_{name}_{int(sid)}.png"))
+
+
+def write_series_json(path, sid, series):
+    out = [{"timestamp": ts.isoformat(), "counts_per_minute": None if pd.isna(val) else float(val)}
+           for ts, val in series.items()]
+    doc = {"sensor_id": str(int(sid)), "series": out}
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(doc, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
+
+
 if __name__ == "__main__":
 
         db_path = DB_NAME
@@ -82,72 +158,31 @@ if __name__ == "__main__":
 
         # check for -png flag on command line
         ENABLE_PNG = "-png" in sys.argv[1:]
+        if ENABLE_PNG:
+            # before the worker pool forks, so the workers inherit it
+            load_matplotlib()
 
         # get unique sensor ids
         cur.execute("SELECT DISTINCT sensor_id FROM radiation_data")
         sensor_rows = cur.fetchall()
         sensor_ids = [r[0] for r in sensor_rows]
 
-        os.makedirs("data", exist_ok=True)
+        # index the timestamp so the time window below is a range scan (no-op if it exists)
+        try:
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_rad_ts ON radiation_data(timestamp)")
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            print(f"Could not create timestamp index: {e}")
+
+        # one query for the longest window; both series are cut from it
+        sensor_series = read_sensor_series(conn, 30)
+        conn.close()
+        no_rows = pd.Series([], index=pd.DatetimeIndex([], tz=TZ), dtype=float, name="counts_per_minute")
 
-        for i,sid in enumerate(sensor_ids):
-            day_data = resample_and_export(sid, 2, "15min")
-            if len(day_data) == 0:
-                continue
-            # prepare JSON output
-            out = []
-            for ts, val in day_data.items():
-                out.append({"timestamp": ts.isoformat(), "counts_per_minute": None if pd.isna(val) else float(val)})
-            out_path = os.path.join("data", f"series_day_{str(int(sid))}.json")
-            with open(out_path, "w", encoding="utf-8") as f:
-                json.dump({"sensor_id": str(int(sid)), "series": out}, f, ensure_ascii=False, indent=2)
-                
-            # also create a PNG plot for first 10 sensors only
-            if ENABLE_PNG and (i <= 10):
-                if not day_data.empty:
-                    fig, ax = plt.subplots(figsize=(10, 4))
-                    ax.plot(day_data.index, day_data.values, marker="o", ms=3, lw=1, color="#1f77b4")
-                    ax.set_xlabel("time")
-                    ax.set_ylabel("counts_per_minute")
-                    ax.set_title(f"Sensor {int(sid)} — last {2} days")
-                    ax.grid(True, alpha=0.3)
-
-                    # pretty time formatting (respect timezone)
-                    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d\n%H:%M", tz=TZ))
-                    fig.autofmt_xdate()
-
-                    out_png = os.path.join("data", f"series_day_{int(sid)}.png")
-                    fig.tight_layout()
-                    fig.savefig(out_png, dpi=150)
-                    plt.close(fig)
-
-            month_data = resample_and_export(sid, 30, "6h")
-            if len(month_data) == 0:
-                continue
-            # prepare JSON output
-            out = []
-            for ts, val in month_data.items():
-                out.append({"timestamp": ts.isoformat(), "counts_per_minute": None if pd.isna(val) else float(val)})
-            out_path = os.path.join("data", f"series_month_{str(int(sid))}.json")
-            with open(out_path, "w", encoding="utf-8") as f:
-                json.dump({"sensor_id": str(int(sid)), "series": out}, f, ensure_ascii=False, indent=2)
-                
-            # also create a PNG plot for first 10 sensors only
-            if ENABLE_PNG and (i <= 10):
-                if not month_data.empty:
-                    fig, ax = plt.subplots(figsize=(10, 4))
-                    ax.plot(month_data.index, month_data.values, marker="o", ms=3, lw=1, color="#1f77b4")
-                    ax.set_xlabel("time")
-                    ax.set_ylabel("counts_per_minute")
-                    ax.set_title(f"Sensor {int(sid)} — last {30} days")
-                    ax.grid(True, alpha=0.3)
-
-                    # pretty time formatting (respect timezone)
-                    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d\n%H:%M", tz=TZ))
-                    fig.autofmt_xdate()
-
-                    out_png = os.path.join("data", f"series_month_{int(sid)}.png")
-                    fig.tight_layout()
-                    fig.savefig(out_png, dpi=150)
-                    plt.close(fig)
+        os.makedirs("data", exist_ok=True)
 
+        # resample, write and plot each sensor in its own process; workers get the series, no db handle
+        tasks = [(i, sid, sensor_series.get(sid, no_rows)) for i, sid in enumerate(sensor_ids)]
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("fork")) as ex:
+            for _ in ex.map(partial(process_sensor, ENABLE_PNG), tasks, chunksize=16):
+                pass
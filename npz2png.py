@@ -9,11 +9,18 @@ import matplotlib.pyplot as plt
 import sys
 
 if len(sys.argv) < 2:
-    print("Usage: python npz2png.py <input_npz_file>")
+    print("Usage: python npz2png.py <input_npz_file | input_npz_zst_file>")
     exit()
     
 
-windData = np.load(sys.argv[1])
+if sys.argv[1].endswith(".zst"):
+    # zstd compressed .npz as written by getWind100.py
+    import io
+    import zstandard as zstd
+    with open(sys.argv[1], "rb") as fh:
+        windData = np.load(io.BytesIO(zstd.ZstdDecompressor().decompress(fh.read())))
+else:
+    windData = np.load(sys.argv[1])
 u_data = windData["u"]
 u_mask = windData["u_mask"]
 v_data = windData["v"]
@@ -25,22 +32,29 @@ speed_mask = windData["speed_mask"]
 
 
 
-# Create a combined valid-data mask and masked arrays
-mask_all = u_mask | v_mask | speed_mask | np.isnan(u_data) | np.isnan(v_data) | np.isnan(speed)
-u_ma = np.ma.array(u_data, mask=mask_all)
-v_ma = np.ma.array(v_data, mask=mask_all)
-speed_ma = np.ma.array(speed, mask=mask_all)
-
-# Decimate the grid for barbs so the plot is legible
-ny, nx = u_ma.shape
+# Decimate the grid for barbs so the plot is legible; only the strided points are masked
+# and plotted, so everything below works on views of the subsample
+ny, nx = u_data.shape
 target_points = 90  # target number of points along long axis
 step_x = max(1, nx // target_points)
 step_y = max(1, ny // target_points)
-
-lons_s = lons[::step_y, ::step_x]
-lats_s = lats[::step_y, ::step_x]
-u_s = u_ma[::step_y, ::step_x]
-v_s = v_ma[::step_y, ::step_x]
+sub = (slice(None, None, step_y), slice(None, None, step_x))
+
+# Create a combined valid-data mask on the subsample
+# (ORed in place into one buffer, one scratch buffer for the NaN tests, skipped for integer data)
+mask_s = u_mask[sub] | v_mask[sub]
+mask_s |= speed_mask[sub]
+nan_buf = np.empty_like(mask_s)
+for a in (u_data, v_data, speed):
+    if np.issubdtype(a.dtype, np.inexact):
+        mask_s |= np.isnan(a[sub], out=nan_buf)
+
+# keep the valid points only (what barbs does with masked arrays)
+valid_s = ~mask_s
+lons_s = lons[sub][valid_s]
+lats_s = lats[sub][valid_s]
+u_s = u_data[sub][valid_s]
+v_s = v_data[sub][valid_s]
 
 # Create figure: background is wind speed, overlay barbs
 fig, ax = plt.subplots(figsize=(16, 8))  # ration is 2 : 1
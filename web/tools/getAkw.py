@@ -4,6 +4,9 @@ Wikidata → CSV + cleaned GeoJSON (merge points ≤ 1 km).
 
 Dependencies:
     pip install requests pandas geopandas shapely
+    pip install numba    # optional, compiles the clustering loop
+    pip install ijson    # optional, streams the SPARQL response
+    pip install pyarrow  # optional, also writes the cleaned output as GeoParquet
 """
 
 import sys
@@ -14,6 +17,7 @@ from pathlib import Path
 # ----------------------------------------------------------------------
 try:
     import requests
+    from requests.adapters import HTTPAdapter
 except ImportError:  # pragma: no cover
     print("Missing dependency. Run: pip install requests pandas geopandas")
     sys.exit(1)
@@ -26,11 +30,29 @@ except ImportError:  # pragma: no cover
 
 try:
     import geopandas as gpd
-    from shapely import wkt
+    import shapely
+    from pyproj import Geod
 except ImportError:  # pragma: no cover
     print("Missing dependency. Run: pip install geopandas")
     sys.exit(1)
 
+import numpy as np
+
+try:
+    import ijson
+except ImportError:  # optional – SPARQL response parsed in one go with resp.json()
+    ijson = None
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:  # optional – no GeoParquet output, GeoJSON/FlatGeobuf only
+    pyarrow = None
+
+try:
+    from numba import njit
+except ImportError:  # optional – union‑find runs as plain Python
+    njit = None
+
 
 # ----------------------------------------------------------------------
 # 2️⃣  SPARQL query (non‑aggregated version – fixed typo)
@@ -86,97 +108,142 @@ ORDER BY ?country ?name
 # ----------------------------------------------------------------------
 # 3️⃣  Helper – make sure the User‑Agent is pure ASCII (prevents latin‑1 error)
 # ----------------------------------------------------------------------
+# Dash‑like characters → ASCII, built once for str.translate
+_DASH_TABLE = str.maketrans({
+    "\u2010": "-",
+    "\u2011": "-",
+    "\u2012": "-",
+    "\u2013": "-",
+    "\u2014": "--",
+    "\u2212": "-",
+})
+
+
 def ascii_header(value: str) -> str:
     """Return an ASCII‑only version of *value*."""
-    repl = {
-        "\u2010": "-",
-        "\u2011": "-",
-        "\u2012": "-",
-        "\u2013": "-",
-        "\u2014": "--",
-        "\u2212": "-",
-    }
-    for src, dst in repl.items():
-        value = value.replace(src, dst)
-    return value.encode("ascii", errors="ignore").decode()
+    return value.translate(_DASH_TABLE).encode("ascii", errors="ignore").decode()
 
 
 # ----------------------------------------------------------------------
 # 4️⃣  Core – run the SPARQL query via HTTP POST
 # ----------------------------------------------------------------------
+# one pooled keep-alive session; requests already asks for gzip/deflate (and br
+# when brotli is installed), the SPARQL JSON compresses very well
+session = requests.Session()
+session.headers.update({
+    "Accept": "application/sparql-results+json",
+    "User-Agent": ascii_header("Lumo-client/1.0 (+https://proton.me/lumo)"),
+})
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+
 def run_sparql(query: str):
     url = "https://query.wikidata.org/sparql"
-    headers = {
-        "Accept": "application/sparql-results+json",
-        "User-Agent": ascii_header("Lumo-client/1.0 (+https://proton.me/lumo)"),
-    }
     payload = {"query": query}
 
     try:
-        resp = requests.post(url, data=payload, headers=headers, timeout=30)
+        resp = session.post(url, data=payload, timeout=30, stream=True)
         resp.raise_for_status()
     except requests.RequestException as exc:  # pragma: no cover
         print(f"Network error while contacting Wikidata: {exc}")
         sys.exit(1)
 
-    data = resp.json()
-    rows = []
-    for binding in data["results"]["bindings"]:
-        flat = {var: val.get("value") for var, val in binding.items()}
-        rows.append(flat)
-    return rows
+    with resp:
+        if ijson is not None:
+            # stream the bindings one by one, the full JSON tree is never built
+            resp.raw.decode_content = True  # undo gzip/deflate content encoding
+            bindings = ijson.items(resp.raw, "results.bindings.item")
+        else:
+            bindings = resp.json()["results"]["bindings"]
+        # one frame with "<var>.type", "<var>.value", … columns; keep the values only
+        flat = pd.json_normalize(list(bindings))
+    val_cols = [c for c in flat.columns if c.endswith(".value")]
+    return flat[val_cols].rename(columns=lambda c: c[:-len(".value")])
 
 
 # ----------------------------------------------------------------------
 # 5️⃣  Geometry helpers – clustering & merging
 # ----------------------------------------------------------------------
-def cluster_points(gdf, max_distance_m=1000):
-    """
-    Assign a cluster id to each point such that any two points
-    ≤ max_distance_m apart belong to the same cluster.
-    """
-    # Work in a metric CRS (Web Mercator) for Euclidean distances ≈ metres.
-    metric = gdf.to_crs(epsg=3857)
+def _find(parent, i):
+    """Root of *i*; path halving: every visited node skips to its grandparent, one pass."""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
 
-    # Spatial index for fast neighbor look‑ups.
-    sindex = metric.sindex
 
-    # Union‑Find (disjoint‑set) structure.
-    parent = list(range(len(metric)))
-
-    def find(i):
-        while parent[i] != i:
-            parent[i] = parent[parent[i]]
-            i = parent[i]
-        return i
-
-    def union(i, j):
-        ri, rj = find(i), find(j)
+def _union_find_ids(i_arr, j_arr, parent, size, label, ids):
+    """
+    Union‑Find (disjoint‑set) over the pairs (i_arr[k], j_arr[k]), union by size so
+    trees stay shallow, then write sequential cluster IDs (0, 1, 2, …) into *ids*.
+    Works on lists (plain Python) as well as numpy arrays (numba).
+    """
+    for k in range(len(i_arr)):
+        ri = _find(parent, i_arr[k])
+        rj = _find(parent, j_arr[k])
         if ri != rj:
+            if size[ri] < size[rj]:
+                ri, rj = rj, ri
             parent[rj] = ri
+            size[ri] += size[rj]
 
-    # Join points that are within the distance threshold.
-    for idx, geom in enumerate(metric.geometry):
-        # Candidate neighbours (bounding‑box filter)
-        candidates = list(sindex.intersection(geom.buffer(max_distance_m).bounds))
-        for other in candidates:
-            if other <= idx:          # avoid double work / self‑compare
-                continue
-            if geom.distance(metric.geometry.iloc[other]) <= max_distance_m:
-                union(idx, other)
-
-    # Compress to sequential cluster IDs (0, 1, 2, …)
-    clusters = {}
-    cluster_ids = []
+    # Compress: roots are numbered in order of their first point (label −1 = not seen yet)
     next_id = 0
-    for i in range(len(parent)):
-        root = find(i)
-        if root not in clusters:
-            clusters[root] = next_id
+    for i in range(len(ids)):
+        root = _find(parent, i)
+        if label[root] < 0:
+            label[root] = next_id
             next_id += 1
-        cluster_ids.append(clusters[root])
+        ids[i] = label[root]
+    return next_id
 
-    return cluster_ids
+
+if njit is not None:
+    # compile _find first, the kernel picks up the compiled version
+    _find = njit(cache=True)(_find)
+    _union_find_ids = njit(cache=True)(_union_find_ids)
+
+
+_GEOD = Geod(ellps="WGS84")
+
+
+def cluster_points(gdf, max_distance_m=1000):
+    """
+    Assign a cluster id to each point (EPSG:4326) such that any two points
+    ≤ max_distance_m apart (geodesic, WGS84) belong to the same cluster.
+    """
+    # Stay in lon/lat: Web Mercator stretches distances by 1/cos(lat), so a metre
+    # threshold there is much too small away from the equator.
+    n = len(gdf)
+    lons = gdf.geometry.x.to_numpy()
+    lats = gdf.geometry.y.to_numpy()
+
+    # Spatial index for fast neighbor look‑ups.
+    sindex = gdf.sindex
+
+    # Prefilter in degrees: one bulk tree query with a per‑point radius large enough for
+    # max_distance_m at that latitude (a degree of latitude is ≥ 110.5 km, a degree of
+    # longitude shrinks with cos(lat)), then keep the pairs within the geodesic distance.
+    deg = max_distance_m / 110_000.0
+    cos_lat = np.cos(np.radians(np.minimum(np.abs(lats) + deg, 89.9)))
+    i_idx, j_idx = sindex.query(gdf.geometry, predicate="dwithin", distance=np.minimum(deg / cos_lat, 360.0))
+    keep = j_idx > i_idx              # avoid double work / self‑compare
+    i_idx, j_idx = i_idx[keep], j_idx[keep]
+    _, _, dist = _GEOD.inv(lons[i_idx], lats[i_idx], lons[j_idx], lats[j_idx])
+    keep = dist <= max_distance_m
+
+    if njit is not None:
+        # int32 arrays: 4 B per node keeps parent/size/label compact for the pointer chasing
+        ids = np.empty(n, dtype=np.int32)
+        _union_find_ids(i_idx[keep].astype(np.int32), j_idx[keep].astype(np.int32),
+                        np.arange(n, dtype=np.int32), np.ones(n, dtype=np.int32),
+                        np.full(n, -1, dtype=np.int32), ids)
+        return ids.tolist()
+
+    # plain lists: scalar indexing of numpy arrays is slower in a Python loop
+    ids = [0] * n
+    _union_find_ids(i_idx[keep].tolist(), j_idx[keep].tolist(), list(range(n)), [1] * n, [-1] * n, ids)
+    return ids
 
 
 def merge_clusters(gdf, cluster_ids):
@@ -189,28 +256,38 @@ def merge_clusters(gdf, cluster_ids):
     """
     gdf = gdf.copy()
     gdf["cluster"] = cluster_ids
-
-    merged = []
-    for cid, grp in gdf.groupby("cluster"):
-        centroid = grp.geometry.unary_union.centroid
-
-        # Helper to build a unique, semicolon‑separated string
-        def uniq(series):
-            vals = series.dropna().unique()
-            return "; ".join(str(v) for v in vals) if vals.size else None
-
-        row = {"geometry": centroid}
-        for col in grp.columns:
-            if col in {"geometry", "cluster"}:
-                continue
-            if col in {"name", "types"}:
-                row[col] = uniq(grp[col])
-            else:
-                # first non‑null value (or None)
-                row[col] = grp[col].dropna().iloc[0] if not grp[col].dropna().empty else None
-        merged.append(row)
-
-    merged_gdf = gpd.GeoDataFrame(merged, crs=gdf.crs)
+    by = gdf["cluster"]
+
+    if (gdf.geom_type == "Point").all():
+        # Point clusters: the centroid is the mean of the distinct coordinates
+        # (duplicates collapse, as with unary_union) – two grouped reductions, no GEOS union
+        pts = pd.DataFrame({"cluster": by, "_x": gdf.geometry.x, "_y": gdf.geometry.y})
+        xy = pts.drop_duplicates().groupby("cluster")[["_x", "_y"]].mean()
+        index, centroids = xy.index, shapely.points(xy["_x"].to_numpy(), xy["_y"].to_numpy())
+    else:
+        # Centroid of each cluster's union (duplicates collapse, as with unary_union)
+        dissolved = gdf[["cluster", "geometry"]].dissolve(by="cluster")
+        index, centroids = dissolved.index, shapely.centroid(dissolved.geometry.values)
+
+    # first non‑null value (or None) of all other columns, one groupby pass; the
+    # reindex below puts the clusters in order, so the groupby need not sort
+    cols = [c for c in gdf.columns if c not in {"geometry", "cluster"}]
+    merged = gdf[[c for c in cols if c not in {"name", "types"}]].groupby(by, sort=False).first()
+
+    for col in {"name", "types"}.intersection(cols):
+        # unique values in order of appearance, semicolon‑separated (None if none)
+        vals = gdf[["cluster", col]].dropna().drop_duplicates()
+        joined = vals[col].astype(str).groupby(vals["cluster"], sort=False).agg("; ".join)
+        joined = joined.reindex(index).astype(object)
+        merged[col] = joined.where(joined.notna(), None)
+
+    merged_gdf = gpd.GeoDataFrame(
+        merged.reindex(index)[cols].reset_index(drop=True),
+        geometry=centroids,
+        crs=gdf.crs,
+    )
+    # geometry first, as the columns of the merged features have always been ordered
+    merged_gdf = merged_gdf[["geometry"] + cols]
     return merged_gdf
 
 
@@ -219,14 +296,12 @@ def merge_clusters(gdf, cluster_ids):
 # ----------------------------------------------------------------------
 def main():
     print("Executing SPARQL query …")
-    rows = run_sparql(QUERY)
-
-    print(f"Retrieved {len(rows)} rows (first few shown):")
-    for i, r in enumerate(rows[:5], start=1):
-        print(f"{i}: {r}")
-
     # ---------- Pandas DataFrame (raw CSV) ----------
-    df = pd.DataFrame(rows)
+    df = run_sparql(QUERY)
+
+    print(f"Retrieved {len(df)} rows (first few shown):")
+    for i, (_, r) in enumerate(df.head().iterrows(), start=1):
+        print(f"{i}: {r.dropna().to_dict()}")
 
     # Convert ISO‑date strings to proper datetimes (optional, useful later)
     date_cols = [
@@ -250,9 +325,12 @@ def main():
         return
 
     gdf = gpd.GeoDataFrame(df.copy())
-    gdf["geometry"] = gdf["geo"].apply(
-        lambda wkt_str: wkt.loads(wkt_str) if isinstance(wkt_str, str) else None
-    )
+    # Parse all WKT strings in one vectorized call (rows without one stay None)
+    geo = gdf["geo"].to_numpy(dtype=object)
+    has_wkt = np.fromiter((isinstance(v, str) for v in geo), dtype=bool, count=len(geo))
+    geoms = np.full(len(geo), None, dtype=object)
+    geoms[has_wkt] = shapely.from_wkt(geo[has_wkt])
+    gdf["geometry"] = geoms
     # Drop rows without a valid geometry
     before = len(gdf)
     gdf = gdf.dropna(subset=["geometry"]).reset_index(drop=True)
@@ -279,6 +357,16 @@ def main():
     merged_gdf.to_file(clean_geojson, driver="GeoJSON")
     print(f"Clean GeoJSON saved to {clean_geojson.resolve()}")
 
+    # Binary copies for non‑web consumers: FlatGeobuf (with spatial index), GeoParquet
+    clean_fgb = Path("nuclear_facilities_clean.fgb")
+    merged_gdf.to_file(clean_fgb, driver="FlatGeobuf")
+    print(f"Clean FlatGeobuf saved to {clean_fgb.resolve()}")
+
+    if pyarrow is not None:
+        clean_parquet = Path("nuclear_facilities_clean.parquet")
+        merged_gdf.to_parquet(clean_parquet, index=False)
+        print(f"Clean GeoParquet saved to {clean_parquet.resolve()}")
+
 
 if __name__ == "__main__":
     main()
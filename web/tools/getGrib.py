@@ -11,7 +11,7 @@
 #   - Select a variable (default: u100)
 #   - Normalize longitudes to -180..180 (if needed)
 #   - Ensure latitude is ascending for a north-up raster
-#   - Write a temporary GeoTIFF in EPSG:4326 with a correct transform
+#   - Build a correct EPSG:4326 transform for the in-memory grid
 #   - Reproject to a target CRS (default EPSG:3857)
 #   - Write a Cloud-Optimized GeoTIFF (COG) with internal tiling + overviews
 #
@@ -31,20 +31,31 @@ from __future__ import annotations
 import argparse
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
 
 import numpy as np
 import xarray as xr
 import rasterio
 from rasterio.enums import Resampling
-from rasterio.transform import from_origin
+from rasterio.io import MemoryFile
+from rasterio.transform import array_bounds, from_origin
 from rasterio import warp
 from rasterio.shutil import copy as rio_copy
 
 
 from ecmwf.opendata import Client
 
+try:
+    import dask  # noqa: F401
+except ImportError:  # optional: without dask the GRIB field is read eagerly
+    dask = None
+
+
+
+INT16_NODATA = -32768
 
 
 def _find_coord_name(da: xr.DataArray, candidates: tuple[str, ...]) -> str:
@@ -76,9 +87,9 @@ def build_geographic_transform(lons: np.ndarray, lats: np.ndarray) -> rasterio.A
     if len(lons) < 2 or len(lats) < 2:
         raise ValueError("Need at least 2 longitudes and 2 latitudes to infer pixel size.")
 
-    # Robust pixel size from median step (handles minor rounding noise)
-    dx = float(np.median(np.diff(lons)))
-    dy = float(np.median(np.diff(lats)))
+    # Pixel size from the end points of the regular, sorted axes (spreads rounding noise evenly)
+    dx = float((lons[-1] - lons[0]) / (len(lons) - 1))
+    dy = float((lats[-1] - lats[0]) / (len(lats) - 1))
     if dx <= 0 or dy <= 0:
         raise ValueError(f"Non-positive pixel size inferred (dx={dx}, dy={dy}). Are coords sorted?")
 
@@ -89,47 +100,70 @@ def build_geographic_transform(lons: np.ndarray, lats: np.ndarray) -> rasterio.A
     return from_origin(west, north, dx, dy)
 
 
-def write_epsg4326_geotiff(path: Path, data: np.ndarray, transform: rasterio.Affine, nodata: float | None) -> None:
-    profile = {
-        "driver": "GTiff",
-        "height": int(data.shape[0]),
-        "width": int(data.shape[1]),
-        "count": 1,
-        "dtype": str(data.dtype),
-        "crs": "EPSG:4326",
-        "transform": transform,
-        "nodata": nodata,
-        "compress": "deflate",
-    }
-    with rasterio.open(path, "w", **profile) as dst:
-        dst.write(data, 1)
-
-
 def reproject_to_cog(
-    src_tif: Path,
+    data: np.ndarray,
+    src_transform: rasterio.Affine,
     dst_cog: Path,
     target_crs: str,
+    nodata: float | None,
     resampling: Resampling = Resampling.bilinear,
     overview_factors: tuple[int, ...] = (2, 4, 8, 16, 32),
+    src_crs: str = "EPSG:4326",
+    scale: float | None = None,
 ) -> None:
     """
-    Reproject src_tif to target_crs, build overviews, then write a COG.
+    Reproject the in-memory src_crs grid to target_crs, build overviews, then write a COG.
 
-    We first write an intermediate tiled GTiff (so overview building is reliable),
-    then (if GDAL supports it) convert to driver=COG. If not, we keep a GTiff
-    that is still largely COG-like (tiled + overviews), but may miss some strict
-    COG metadata.
+    With scale set, the warped field is quantized to int16 (value = raw * scale,
+    nodata = -32768) and the scale/offset is stored in the band metadata, so
+    readers that honour GDAL scale/offset get physical units back.
+
+    The reprojected raster is staged as a tiled GTiff in a MemoryFile (so overview
+    building is reliable), then (if GDAL supports it) converted to driver=COG. If
+    not, the staged GTiff is written as-is: still largely COG-like (tiled +
+    overviews), but may miss some strict COG metadata.
     """
-    tmp_reproj = src_tif.with_suffix(".reproj.tif")
+    height, width = data.shape
+    left, bottom, right, top = array_bounds(height, width, src_transform)
 
-    with rasterio.open(src_tif) as src:
+    # Let GDAL use all cores for the warp kernel, the overviews and the COG compression pass.
+    with rasterio.Env(GDAL_NUM_THREADS="ALL_CPUS", GDAL_CACHEMAX=512):
         dst_transform, dst_width, dst_height = warp.calculate_default_transform(
-            src.crs, target_crs, src.width, src.height, *src.bounds
+            src_crs, target_crs, width, height, left, bottom, right, top
         )
 
-        reproj_profile = src.profile.copy()
-        reproj_profile.update(
+        # Allocate destination array and reproject straight from the source array
+        dest = np.empty((int(dst_height), int(dst_width)), dtype=data.dtype)
+
+        warp.reproject(
+            source=data,
+            destination=dest,
+            src_transform=src_transform,
+            src_crs=src_crs,
+            dst_transform=dst_transform,
+            dst_crs=target_crs,
+            resampling=resampling,
+            src_nodata=nodata,
+            dst_nodata=nodata,
+            num_threads=os.cpu_count() or 1,
+            warp_mem_limit=512,
+        )
+
+        out_nodata = nodata
+        if scale:
+            # Quantize after warping so the bilinear kernel still runs on the float field
+            invalid = np.isnan(dest) if nodata is None else (np.isnan(dest) | (dest == nodata))
+            q = np.rint(dest / scale)
+            np.clip(q, -32767, 32767, out=q)
+            q[invalid] = INT16_NODATA
+            dest = q.astype(np.int16)
+            out_nodata = INT16_NODATA
+
+        floating = np.issubdtype(dest.dtype, np.floating)
+        reproj_profile = dict(
             driver="GTiff",
+            dtype=str(dest.dtype),
+            nodata=out_nodata,
             crs=target_crs,
             transform=dst_transform,
             width=int(dst_width),
@@ -137,53 +171,72 @@ def reproject_to_cog(
             tiled=True,
             blockxsize=256,
             blockysize=256,
-            compress="deflate",
-            predictor=3 if np.issubdtype(src.dtypes[0], np.floating) else 2,
+            compress="zstd",
+            zstd_level=3,
+            predictor=3 if floating else 2,
             BIGTIFF="IF_SAFER",
             count=1,
             interleave="band",
         )
 
-        # Allocate destination array and reproject into it (more robust than band->band across versions)
-        dest = np.empty((int(dst_height), int(dst_width)), dtype=src.dtypes[0])
-
-        warp.reproject(
-            source=rasterio.band(src, 1),
-            destination=dest,
-            src_transform=src.transform,
-            src_crs=src.crs,
-            dst_transform=dst_transform,
-            dst_crs=target_crs,
-            resampling=resampling,
-            src_nodata=src.nodata,
-            dst_nodata=src.nodata,
-        )
-
-        with rasterio.open(tmp_reproj, "w", **reproj_profile) as dst:
-            dst.write(dest, 1)
-            dst.build_overviews(list(overview_factors), Resampling.nearest)
-            dst.update_tags(ns="rio_overview", resampling="nearest")
+        with MemoryFile() as mem:
+            with mem.open(**reproj_profile) as dst:
+                dst.write(dest, 1)
+                if scale:
+                    dst.scales = (scale,)
+                    dst.offsets = (0.0,)
+                dst.build_overviews(list(overview_factors), Resampling.nearest)
+                dst.update_tags(ns="rio_overview", resampling="nearest")
+
+            # Try to produce a proper COG using the COG driver (if available).
+            # Fall back to writing the tiled GeoTIFF if COG driver isn't present.
+            try:
+                rio_copy(
+                    mem.name,
+                    dst_cog,
+                    driver="COG",
+                    # ZSTD is several times faster than deflate at a similar ratio and
+                    # compresses the tiles in parallel with NUM_THREADS
+                    compress="zstd",
+                    level=3,
+                    predictor="FLOATING_POINT" if floating else "STANDARD",
+                    # These are GDAL COG creation options; ignored if unsupported.
+                    blocksize=256,
+                    overview_resampling="NEAREST",
+                    num_threads="ALL_CPUS",
+                )
+            except Exception:
+                # Fallback: keep the reprojected GTiff as-is (still tiled + overviews).
+                mem.seek(0)
+                dst_cog.write_bytes(mem.read())
+
+
+DOWNLOAD_WORKERS = 8
+CHUNK_SIZE = 1 << 20
+
+# one pooled keep-alive session, sized so every range worker keeps its connection
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_WORKERS))
+
+
+def _fetch_range(url: str, fd: int, start: int, end: int, etag: str | None) -> None:
+    """Download bytes start..end (inclusive) of url and pwrite them at the same offset of fd."""
+    # byte offsets only line up with the file if the body is not content-encoded
+    headers = {"Range": f"bytes={start}-{end}", "Accept-Encoding": "identity"}
+    if etag:
+        # the server answers 200 with the whole file if it changed meanwhile
+        headers["If-Range"] = etag
+    with session.get(url, headers=headers, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise requests.HTTPError(f"Range request not honoured (HTTP {r.status_code})")
+        pos = start
+        for chunk in r.iter_content(CHUNK_SIZE):
+            os.pwrite(fd, chunk, pos)
+            pos += len(chunk)
+    if pos != end + 1:
+        raise requests.HTTPError(f"Short range response: got bytes {start}-{pos - 1} of {start}-{end}")
 
-    # Try to produce a proper COG using the COG driver (if available).
-    # Fall back to copying the tiled GeoTIFF if COG driver isn't present.
-    try:
-        rio_copy(
-            tmp_reproj,
-            dst_cog,
-            driver="COG",
-            compress="deflate",
-            # These are GDAL COG creation options; ignored if unsupported.
-            blocksize=256,
-            overview_resampling="NEAREST",
-        )
-    except Exception:
-        # Fallback: keep the reprojected GTiff as-is (still tiled + overviews).
-        if dst_cog.exists():
-            dst_cog.unlink()
-        os.replace(tmp_reproj, dst_cog)
-    else:
-        # If COG succeeded, remove the intermediate file.
-        tmp_reproj.unlink(missing_ok=True)
 
 def rawRequests(target = "aifs_ens_cf_medium-wind-100m.grib") -> None:
 
@@ -193,26 +246,46 @@ def rawRequests(target = "aifs_ens_cf_medium-wind-100m.grib") -> None:
         "aifs_ens_cf_medium-wind-100m.grib"
     )
 
-    headers = {}
+    headers = {"Accept-Encoding": "identity"}
     etag_file = f"{target}.etag"
 
     if os.path.exists(etag_file):
         with open(etag_file) as f:
             headers["If-None-Match"] = f.read().strip()
 
-    r = requests.get(URL, headers=headers, stream=True, timeout=60)
+    head = session.head(URL, headers=headers, timeout=60, allow_redirects=True)
 
-    if r.status_code == 304:
+    if head.status_code == 304:
         print("Already latest")
+        return
+    head.raise_for_status()
+
+    total = int(head.headers.get("Content-Length", 0))
+    etag = head.headers.get("ETag")
+
+    if total > CHUNK_SIZE and head.headers.get("Accept-Ranges", "").lower() == "bytes":
+        # Split into one byte range per worker, each written at its offset of the preallocated file
+        part = -(-total // DOWNLOAD_WORKERS)
+        with open(target, "wb") as f:
+            f.truncate(total)
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+                futures = [
+                    pool.submit(_fetch_range, URL, f.fileno(), start, min(start + part, total) - 1, etag)
+                    for start in range(0, total, part)
+                ]
+                for future in futures:
+                    future.result()
     else:
+        r = session.get(URL, stream=True, timeout=60)
         r.raise_for_status()
         with open(target, "wb") as f:
-            for chunk in r.iter_content(8192):
+            for chunk in r.iter_content(CHUNK_SIZE):
                 f.write(chunk)
+        etag = r.headers.get("ETag")
 
-        if "ETag" in r.headers:
-            with open(etag_file, "w") as f:
-                f.write(r.headers["ETag"])
+    if etag:
+        with open(etag_file, "w") as f:
+            f.write(etag)
 
 
 def main() -> None:
@@ -220,19 +293,21 @@ def main() -> None:
     ap.add_argument("grib", nargs="?", default="aifs_ens_cf_medium-wind-100m.grib", help="Input GRIB path")
     ap.add_argument("--var", default="u100", help="Variable name inside GRIB (default: u100)")
     ap.add_argument("--out", default="u100_cog.tif", help="Output COG GeoTIFF path")
-    ap.add_argument("--tmp", default="ugrd_temp_epsg4326.tif", help="Temporary EPSG:4326 GeoTIFF path")
     ap.add_argument("--target-crs", default="EPSG:3857", help="Target CRS (default: EPSG:3857)")
     ap.add_argument("--nodata", type=float, default=np.nan, help="Nodata value to write (default: NaN)")
+    ap.add_argument("--scale", type=float, default=0.01,
+                    help="Quantize the COG to int16 with this scale (default: 0.01; 0 keeps float32)")
     ap.add_argument("--raw", action="store_true", help="Use raw requests to download GRIB")
     args = ap.parse_args()
 
+    grib_path = Path(args.grib)
+
     if args.raw:
         rawRequests(target=args.grib)
     else:
         client = Client("ecmwf", beta=False, model="aifs-ens")
 
         parameters = ['100u', '100v','msl']
-        grib_path = Path(args.grib)
 
         client.retrieve(
             date=0,
@@ -249,12 +324,12 @@ def main() -> None:
     if not grib_path.exists():
         sys.exit(f"❌ GRIB not found: {grib_path}")
 
-    tmp_tif = Path(args.tmp)
     out_cog = Path(args.out)
 
     # 1) Open GRIB
     try:
-        ds = xr.open_dataset(grib_path, engine="cfgrib")
+        # With dask the field stays lazy until the float32 cast below loads it
+        ds = xr.open_dataset(grib_path, engine="cfgrib", chunks={} if dask is not None else None)
     except Exception as exc:
         sys.exit(f"❌ Unable to open GRIB with cfgrib: {exc}")
 
@@ -290,44 +365,43 @@ def main() -> None:
     # 4) Ensure latitude ascending (south->north)
     lats = da[lat_name].values
     if lats[0] > lats[-1]:
+        if dask is not None:
+            da = da.chunk({lat_name: -1})
         da = da.sortby(lat_name)
         lats = da[lat_name].values
 
-    # 5) Build transform and write EPSG:4326 GeoTIFF
+    # 5) Build EPSG:4326 transform
     transform = build_geographic_transform(lon_norm, lats)
 
-    data = da.values.astype(np.float32)
+    # Cast while loading; no extra copy when the field is already float32
+    data = da.astype(np.float32, copy=False).values
     nodata = None if (isinstance(args.nodata, float) and np.isnan(args.nodata)) else float(args.nodata)
 
-    write_epsg4326_geotiff(tmp_tif, data, transform, nodata)
-
-    # 6) Reproject + COG
-    reproject_to_cog(tmp_tif, out_cog, args.target_crs, resampling=Resampling.bilinear)
+    # 6) Reproject + COG (straight from the in-memory grid, no temp GeoTIFF)
+    reproject_to_cog(data, transform, out_cog, args.target_crs, nodata,
+                     resampling=Resampling.bilinear, scale=args.scale or None)
 
     # 7) Diagnostics
-    with rasterio.open(tmp_tif) as src:
-        arr = src.read(1)
-        print("\n🔎 EPSG:4326 temp GeoTIFF")
-        print(f"  shape    : {arr.shape}")
-        print(f"  dtype    : {arr.dtype}")
-        print(f"  min / max: {np.nanmin(arr):.3f} / {np.nanmax(arr):.3f}")
-        print(f"  CRS      : {src.crs}")
-        print(f"  Transform: {src.transform}")
+    print("\n🔎 EPSG:4326 source grid")
+    print(f"  shape    : {data.shape}")
+    print(f"  dtype    : {data.dtype}")
+    print(f"  min / max: {np.nanmin(data):.3f} / {np.nanmax(data):.3f}")
+    print(f"  CRS      : EPSG:4326")
+    print(f"  Transform: {transform}")
 
     with rasterio.open(out_cog) as src:
         arr = src.read(1, masked=True)
+        # Report physical units for a quantized COG
+        arr = arr * src.scales[0] + src.offsets[0]
         print("\n✅ Output COG / tiled GeoTIFF")
         print(f"  path     : {out_cog}")
         print(f"  shape    : {arr.shape}")
-        print(f"  dtype    : {arr.dtype}")
+        print(f"  dtype    : {src.dtypes[0]}")
         print(f"  min / max: {arr.min():.3f} / {arr.max():.3f}")
         print(f"  CRS      : {src.crs}")
         print(f"  tiled    : {src.is_tiled}")
         print(f"  overviews: {src.overviews(1)}")
 
-    # 8) Cleanup temp
-    tmp_tif.unlink(missing_ok=True)
-
 
 if __name__ == "__main__":
     main()